@@ -7,16 +7,20 @@ from model import ConditionalTabularModel
 
 # External libraries
 import matplotlib.pyplot as plt
-import numpy as np
 import pandas as pd
 import seaborn as sns
 import torch
+import torch.distributed as dist
+import torch.nn as nn
 import torch.optim as optim
 from torch.nn.utils import clip_grad
 
 
-class Diffusion():
+class Diffusion(nn.Module):
     """Diffusion model class
+
+    The schedule tensors are registered as buffers, so a single .to(device) moves
+    every one of them and consumers never see a CPU/GPU mix.
     """
 
 
@@ -33,25 +37,30 @@ class Diffusion():
         self.num_steps = num_steps
         # For continuous noise
         # Beta scheduler
-        self.betas = utils.make_beta_schedule(schedule='linear', n_timesteps=num_steps, start=1e-5, end=0.5e-2)
+        self.register_buffer('betas', utils.make_beta_schedule(schedule='linear', n_timesteps=num_steps, start=1e-5, end=0.5e-2))
         # Alphas
-        self.alphas = 1 - self.betas
+        self.register_buffer('alphas', 1 - self.betas)
         # Cumulative product of alphas
-        self.alphas_prod = torch.cumprod(self.alphas, 0)
+        self.register_buffer('alphas_prod', torch.cumprod(self.alphas, 0))
         # Square root of the cumulative product of alphas
-        self.alphas_bar_sqrt = torch.sqrt(self.alphas_prod)
+        self.register_buffer('alphas_bar_sqrt', torch.sqrt(self.alphas_prod))
         # One minus the cumulative product of alphas
-        self.one_minus_alphas_bar_sqrt = torch.sqrt(1 - self.alphas_prod)
+        self.register_buffer('one_minus_alphas_bar_sqrt', torch.sqrt(1 - self.alphas_prod))
+        # Complements cached once so the losses can gather them instead of recomputing per call
+        self.register_buffer('one_minus_alphas', 1 - self.alphas)
+        self.register_buffer('one_minus_alphas_prod', 1 - self.alphas_prod)
+        # Schedule rows stacked so the losses gather all four values with one index_select
+        self.register_buffer('cat_schedule', torch.stack([self.alphas, self.one_minus_alphas, self.alphas_prod, self.one_minus_alphas_prod], dim=1))
 
         # For categorical noise
         # Log of alphas
-        self.log_alphas = np.log(self.alphas)
+        self.register_buffer('log_alphas', torch.log(self.alphas))
         # One minus log of alphas
-        self.one_minus_log_alphas = utils.log_1_min_a(self.log_alphas)
+        self.register_buffer('one_minus_log_alphas', utils.log_1_min_a(self.log_alphas))
         # Cumulative sum of log of alphas
-        self.log_cumprod_alpha = np.cumsum(self.log_alphas)
+        self.register_buffer('log_cumprod_alpha', torch.cumsum(self.log_alphas, 0))
         # One minus log of cumulative sum
-        self.log_1_min_cumprod_alpha = utils.log_1_min_a(self.log_cumprod_alpha)
+        self.register_buffer('log_1_min_cumprod_alpha', utils.log_1_min_a(self.log_cumprod_alpha))
 
 
 def get_denoising_variables(num_steps):
@@ -68,7 +77,26 @@ def get_denoising_variables(num_steps):
     return diffusion
 
 
-def q_x(x_0, t, model, noise=None):
+def build_ddp_model(model, device_id):
+    """Wraps a model in DistributedDataParallel for one-process-per-GPU training
+
+    Args:
+        model (nn.Module): the model to wrap, already constructed on any device
+        device_id (int): the CUDA device index for this rank, or None on CPU
+
+    Returns:
+        (DistributedDataParallel): the wrapped model, moved to the device
+    """
+    if device_id is not None:
+        model = model.to(torch.device('cuda', device_id))
+        device_ids = [device_id]
+    else:
+        device_ids = None
+    # the default 25MB gradient buckets are a good fit for these small MLPs
+    return nn.parallel.DistributedDataParallel(model, device_ids=device_ids, bucket_cap_mb=25)
+
+
+def q_x(x_0, t, model, noise=None, noise_buf=None, generator=None):
     """Function to add t time steps of noise to continuous data x
 
     Args:
@@ -76,12 +104,19 @@ def q_x(x_0, t, model, noise=None):
         t (torch.Tensor): the number of time steps to add
         model (class: Diffusion): a diffusion model class encapsulating proper constants for forward diffusion
                                 Constants calculated from num_steps input to class constructor
+        noise (torch.Tensor): optional pre-made noise to apply instead of sampling fresh noise
+        noise_buf (torch.Tensor): optional preallocated buffer (same shape as x_0) to fill with
+                                  fresh noise, so callers in a loop reuse one allocation
+        generator (torch.Generator): optional RNG to draw the noise from
 
     Returns:
         (torch.Tensor): the data with the noise added to it
     """
     if noise is None:
-        noise = torch.randn_like(x_0)
+        if noise_buf is not None:
+            noise = torch.randn(x_0.shape, out=noise_buf, generator=generator)
+        else:
+            noise = torch.randn(x_0.shape, generator=generator, dtype=x_0.dtype, device=x_0.device)
     alphas_t = utils.extract(model.alphas_bar_sqrt, t, x_0)
     alphas_1_m_t = utils.extract(model.one_minus_alphas_bar_sqrt, t, x_0)
     return (alphas_t * x_0 + alphas_1_m_t * noise)
@@ -100,16 +135,21 @@ def visualize_forward(dataset, num_steps, num_divs, diffusion):
     axs[0].scatter(dataset[:, 0], dataset[:, 1],color='white',edgecolor='gray', s=5)
     axs[0].set_axis_off()
     axs[0].set_title('$q(\\mathbf{x}_{'+str(0)+'})$')
+    # Add the noise for every plotted step in one batched q_x_cat call instead of one call per plot
+    num_samples = dataset.shape[0]
+    ts = torch.tensor([i * int(num_steps/num_divs) - 1 for i in range(1, num_divs + 1)])
+    t_all = ts.repeat_interleave(num_samples)
+    x_all = dataset.repeat(num_divs, 1)
+    q_all = utils.q_x_cat(x_all, diffusion, t_all, 2).view(num_divs, num_samples, -1)
     for i in range(1, num_divs + 1):
-        # q_i = q_x(dataset, torch.tensor([i * int(num_steps/num_divs) - 1]), diffusion)
-        q_i = utils.q_x_cat(dataset, torch.tensor([i * int(num_steps/num_divs) - 1]), diffusion, torch.tensor([2]))
+        q_i = q_all[i - 1]
         axs[i].scatter(q_i[:, 0], q_i[:, 1],color='white',edgecolor='gray', s=5)
         axs[i].set_axis_off()
         axs[i].set_title('$q(\\mathbf{x}_{'+str(i*int(num_steps/num_divs))+'})$')
     plt.show()
 
 
-def visualize_backward(model, dataset, num_steps, num_divs, diffusion, heatmap=False, reverse=False):
+def visualize_backward(model, dataset, num_steps, num_divs, diffusion, heatmap=False, reverse=False, x_seq=None):
     """Vizualizes the backwards diffusion process
 
     Args:
@@ -119,8 +159,17 @@ def visualize_backward(model, dataset, num_steps, num_divs, diffusion, heatmap=F
         num_divs (int): number of graphs to plot
         diffusion (class: Diffusion): a diffusion class which captures forward diffusion variables
         reverse (bool): If true, will plot the graphs in reverse
+        x_seq (list<torch.Tensor>): optional precomputed denoising trajectory.  Pass the
+                                    return value of a previous call to reuse one trajectory
+                                    across several visualizations
+
+    Returns:
+        x_seq (list<torch.Tensor>): the denoising trajectory that was plotted
     """
-    x_seq = utils.p_sample_loop(model, dataset.shape,num_steps,diffusion.alphas,diffusion.betas,diffusion.one_minus_alphas_bar_sqrt)
+    # Only run the full reverse chain when the caller did not supply one
+    if x_seq is None:
+        with torch.inference_mode():
+            x_seq = utils.p_sample_loop(model, dataset.shape,num_steps,diffusion.alphas,diffusion.betas,diffusion.one_minus_alphas_bar_sqrt)
     _, axs = plt.subplots(2, num_divs+1, figsize=(28, 6))
     for i in range(num_divs + 1):
         cur_x = x_seq[i * int(num_steps/num_divs)].detach()
@@ -132,6 +181,8 @@ def visualize_backward(model, dataset, num_steps, num_divs, diffusion, heatmap=F
             cur_df = pd.DataFrame(cur_x)
             sns.kdeplot(data=cur_df, x=0, y=1, fill=True, thresh=0, levels=100, ax=axs[1, i if not reverse else num_divs-i], cmap="mako")
 
+    return x_seq
+
 
 def forward_diffusion(dataset, num_steps, plot=False, num_divs=10):
     """Applies forward diffusion to the dataset with the given number of steps
@@ -172,6 +223,10 @@ def reverse_tabular_diffusion(discrete_tr, continuous_tr, discrete_vl, continuou
                               continuous_lr=1., discrete_lr=1.,
                               training_time_steps=None,
                               model=None, show_loss=True,
+                              compile_model=True, compile_mode='reduce-overhead',
+                              use_cuda_graph=False, use_amp=False,
+                              distributed=False,
+                              sample_every=None,
                               es_patience=500, es_delta=0.3):
     """Applies reverse diffusion to a dataset
 
@@ -188,6 +243,17 @@ def reverse_tabular_diffusion(discrete_tr, continuous_tr, discrete_vl, continuou
         training_time_steps (int): number of training steps to remove noise.  Default is step_size from diffusion class
         model (ConditionalModel): optional argument to train a previously defined model
         show_loss (bool): default True, print loss statistics
+        compile_model (bool): default True, compile the model with torch.compile when available
+        compile_mode (string): the torch.compile mode to use when compiling the model
+        use_cuda_graph (bool): default False, capture the training step in a CUDA graph and
+                               replay it per batch.  Requires CUDA and disables compile_model
+        use_amp (bool): default False, run the losses under mixed precision autocast on CUDA
+                        (bf16 where supported, otherwise fp16 with gradient scaling)
+        distributed (bool): default False, train under DistributedDataParallel with one process
+                            per GPU.  The launcher must call dist.init_process_group before
+                            this function runs; each rank trains a disjoint shard of the data
+        sample_every (int): how often (in training steps) to sample the diagnostic discrete
+                            distribution.  Default is every training_time_steps // 20 steps
         es_patience (int): early stopping patience -- number of iterations where validation loss does not decrease before early stopping training
         es_delta (float): early stopping delta -- minimum change in the validation loss to qualify as an improvement
 
@@ -196,6 +262,34 @@ def reverse_tabular_diffusion(discrete_tr, continuous_tr, discrete_vl, continuou
         loss_list (list<float>): the list of losses from the training
         discrete_distribution_list (list<torch.Tensor>): the list of discrete distribution
     """
+    # TF32 matmuls for the small MLPs on hardware that has it
+    utils.set_performance_flags()
+
+    # Hashable, immutable feature layout so the compiler can treat it as a static constant
+    feature_indices = tuple(tuple(index) for index in feature_indices)
+
+    # Each rank pins its own GPU; the launcher has already called dist.init_process_group
+    rank, world_size = 0, 1
+    if distributed:
+        rank = dist.get_rank()
+        world_size = dist.get_world_size()
+        # Graph capture and the DDP gradient sync hooks do not mix; DDP wins here
+        use_cuda_graph = False
+        # Only rank 0 reports progress
+        show_loss = show_loss and rank == 0
+
+    # Move the data and schedule tensors to GPU once so per-batch host to device copies are avoided
+    if torch.cuda.is_available():
+        device = torch.device('cuda', rank % torch.cuda.device_count())
+    else:
+        device = torch.device('cpu')
+    if device.type == 'cuda':
+        discrete_tr = discrete_tr.pin_memory().to(device, non_blocking=True)
+        continuous_tr = continuous_tr.pin_memory().to(device, non_blocking=True)
+        discrete_vl = discrete_vl.pin_memory().to(device, non_blocking=True)
+        continuous_vl = continuous_vl.pin_memory().to(device, non_blocking=True)
+        diffusion.to(device)
+
     # Load variables from diffusion class
     training_loss, validation_loss = None, None
     num_steps = diffusion.num_steps
@@ -205,12 +299,38 @@ def reverse_tabular_diffusion(discrete_tr, continuous_tr, discrete_vl, continuou
     if training_time_steps is None:
         training_time_steps = num_steps
 
+    # Sampling 1000 diagnostic points through the model costs more than a training step,
+    # so only do it periodically rather than every epoch
+    if sample_every is None:
+        sample_every = max(1, training_time_steps // 20)
+
     # If no model given, create new one
     if model is None:
         hidden_size = 128
-        model = ConditionalTabularModel(num_steps, hidden_size, continuous_tr.shape[1], k)
-
-    optimizer = optim.Adam(model.parameters(), lr=optim_lr)
+        model = ConditionalTabularModel(num_steps, hidden_size, continuous_tr.shape[1], k, feature_indices)
+    model = model.to(device)
+
+    # DistributedDataParallel averages gradients across ranks during backward
+    # (DataParallel is deliberately avoided -- single-process multi-GPU scales poorly)
+    if distributed:
+        model = build_ddp_model(model, device.index if device.type == 'cuda' else None)
+
+    # Compile the model so the MLP matmuls/activations are fused into fewer kernels (PyTorch 2.0+)
+    # Skipped under explicit CUDA graph capture since the two mechanisms overlap
+    if compile_model and not use_cuda_graph:
+        model = utils.compile_module(model, mode=compile_mode)
+
+    # The fused Adam applies the update for all parameter tensors in one kernel
+    # The optimizer state must be capturable for its step to be recorded in a CUDA graph
+    optimizer = optim.Adam(model.parameters(), lr=optim_lr,
+                           fused=device.type == 'cuda' and not use_cuda_graph,
+                           capturable=use_cuda_graph and device.type == 'cuda')
+
+    # Mixed precision keeps the weights FP32 but halves matmul bandwidth in the forward/backward
+    # bf16 needs no loss scaling, fp16 falls back to a GradScaler.  Not supported under graph capture
+    use_amp = use_amp and device.type == 'cuda' and not use_cuda_graph
+    amp_dtype = torch.bfloat16 if use_amp and torch.cuda.is_bf16_supported() else torch.float16
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp and amp_dtype == torch.float16)
 
     # Create EMA model
     ema = EMA(0.9)
@@ -224,99 +344,171 @@ def reverse_tabular_diffusion(discrete_tr, continuous_tr, discrete_vl, continuou
     validation_loss_list = []
     discrete_distribution_list = []
 
+    # Drop the trailing non-full batch so the compiled model always sees a fixed batch shape
+    # Under DDP each rank only walks its own 1/world_size shard of the rows
+    batch_stop = max(((continuous_tr.shape[0] // world_size) // batch_size) * batch_size, 1)
+
+    # Hoisted out of the hot loop so the logging cadence is computed once
+    log_every = max(1, training_time_steps // 10)
+
+    # One hot encode the discrete features once instead of re-encoding every minibatch/epoch
+    discrete_tr_oh = utils.to_one_hot(discrete_tr, feature_indices)
+    discrete_vl_oh = utils.to_one_hot(discrete_vl, feature_indices)
+
+    def train_step(batch_x_continuous, batch_x_discrete):
+        """Runs one optimization step and returns the discrete, continuous, and combined losses"""
+        # Compute both losses from a single forward pass
+        with torch.autocast('cuda', dtype=amp_dtype, enabled=use_amp):
+            continuous_loss, multinomial_loss = utils.joint_noise_estimation_loss(model,
+                                                                                  batch_x_continuous,
+                                                                                  batch_x_discrete,
+                                                                                  diffusion,
+                                                                                  k,
+                                                                                  feature_indices,
+                                                                                  alphas_bar_sqrt,
+                                                                                  one_minus_alphas_bar_sqrt,
+                                                                                  num_steps)
+            multinomial_loss = multinomial_loss * discrete_lr
+            continuous_loss = continuous_loss * continuous_lr
+            loss = multinomial_loss + continuous_loss
+        # Free the network gradients instead of writing zeros over them
+        # Graph capture needs static gradient storage, so it keeps the zeroing behavior
+        optimizer.zero_grad(set_to_none=not use_cuda_graph)
+        # Backward pass: compute gradient of the loss with respect to parameters
+        scaler.scale(loss).backward()
+        # Perform gradient clipping on unscaled gradients
+        scaler.unscale_(optimizer)
+        clip_grad.clip_grad_norm_(model.parameters(), 1., foreach=True)
+        # Calling the step function to update the parameters
+        scaler.step(optimizer)
+        scaler.update()
+        # Update the exponential moving average
+        ema.update(model)
+        return multinomial_loss, continuous_loss, loss
+
+    # Optionally record the whole training step in a CUDA graph so each batch replays one
+    # captured kernel sequence instead of relaunching every kernel (fixed batch shapes only)
+    graph, static_continuous, static_discrete, static_losses = None, None, None, None
+    if use_cuda_graph and device.type == 'cuda' and continuous_tr.shape[0] >= batch_size:
+        model.train()
+        static_continuous = continuous_tr[:batch_size].clone()
+        static_discrete = discrete_tr_oh[:batch_size].clone()
+        # Warm up the optimizer state on a side stream before capturing
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                train_step(static_continuous, static_discrete)
+        torch.cuda.current_stream().wait_stream(stream)
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_losses = train_step(static_continuous, static_discrete)
+
     for t in range(training_time_steps):
         tr_multinomial_loss, tr_continuous_loss = 0, 0
         vl_multinomial_loss, vl_continuous_loss = 0, 0
-        permutation_discrete = torch.randperm(discrete_tr.shape[0])
-        permutation_continuous = torch.randperm(continuous_tr.shape[0])
-        for i in range(0, continuous_tr.shape[0], batch_size):
-            # Put model in training mode
-            model.train()
+        # One shared permutation keeps discrete/continuous rows of the same sample together
+        if distributed:
+            # Every rank draws the same epoch-seeded permutation, then keeps a disjoint slice
+            g = torch.Generator(device=continuous_tr.device)
+            g.manual_seed(t)
+            permutation = torch.randperm(continuous_tr.shape[0], generator=g, device=continuous_tr.device)[rank::world_size]
+        else:
+            permutation = torch.randperm(continuous_tr.shape[0], device=continuous_tr.device)
+        # Prebuild every batch index row for the epoch so the loop just walks the rows
+        if permutation.shape[0] >= batch_size:
+            batch_indices = permutation[:batch_stop].view(-1, batch_size)
+        else:
+            batch_indices = permutation.unsqueeze(0)
+        # Put model in training mode
+        model.train()
+        for indices in batch_indices.unbind(0):
             # Retrieve current batch
-            indices_discrete = permutation_discrete[i:i+batch_size]
-            indices_continuous = permutation_continuous[i:i+batch_size]
-            batch_x_discrete = discrete_tr[indices_discrete]
-            batch_x_continuous = continuous_tr[indices_continuous]
-            # One hot encoding
-            batch_x_discrete = utils.to_one_hot(batch_x_discrete, feature_indices)
-            # Compute the loss
-            tr_multinomial_loss = utils.categorical_noise_estimation_loss(model,
-                                                                          batch_x_continuous,
-                                                                          batch_x_discrete,
-                                                                          diffusion,
-                                                                          k,
-                                                                          feature_indices) * discrete_lr
-            tr_continuous_loss = utils.continuous_noise_estimation_loss(model,
-                                                                        batch_x_continuous,
-                                                                        batch_x_discrete,
-                                                                        feature_indices,
-                                                                        k,
-                                                                        alphas_bar_sqrt,
-                                                                        one_minus_alphas_bar_sqrt,
-                                                                        num_steps) * continuous_lr
-            training_loss = tr_multinomial_loss + tr_continuous_loss
-            # Before the backward pass, zero all of the network gradients
-            optimizer.zero_grad()
-            # Backward pass: compute gradient of the loss with respect to parameters
-            training_loss.backward()
-            # Perform gradient clipping
-            clip_grad.clip_grad_norm_(model.parameters(), 1.)
-            # Calling the step function to update the parameters
-            optimizer.step()
-            # Update the exponential moving average
-            ema.update(model)
+            batch_x_discrete = discrete_tr_oh.index_select(0, indices)
+            batch_x_continuous = continuous_tr.index_select(0, indices)
+            if graph is not None and indices.shape[0] == batch_size:
+                # Copy the batch into the capture buffers and replay the recorded step
+                static_continuous.copy_(batch_x_continuous, non_blocking=True)
+                static_discrete.copy_(batch_x_discrete, non_blocking=True)
+                graph.replay()
+                tr_multinomial_loss, tr_continuous_loss, training_loss = static_losses
+            else:
+                tr_multinomial_loss, tr_continuous_loss, training_loss = train_step(batch_x_continuous, batch_x_discrete)
 
         # Put model in evaluation mode to get validation loss
         model.eval()
-        # Compute validation loss
-        discrete_vl = utils.to_one_hot(discrete_vl, feature_indices)
-        vl_multinomial_loss = utils.categorical_noise_estimation_loss(model,
-                                                                      continuous_vl,
-                                                                      discrete_vl,
-                                                                      diffusion,
-                                                                      k,
-                                                                      feature_indices) * discrete_lr
-        vl_continuous_loss = utils.continuous_noise_estimation_loss(model,
-                                                                    continuous_vl,
-                                                                    discrete_vl,
-                                                                    feature_indices,
-                                                                    k,
-                                                                    alphas_bar_sqrt,
-                                                                    one_minus_alphas_bar_sqrt,
-                                                                    num_steps) * continuous_lr
-        validation_loss = vl_multinomial_loss + vl_continuous_loss
-
-        # get discrete distribution
-        _,_, discrete_distribution = utils.get_tabular_model_output(model, k, 1000, feature_indices, continuous_tr.shape[1], diffusion, calculate_continuous=False)
-        discrete_distribution_list.append(discrete_distribution.squeeze(0))
+        # Compute validation loss without autograd bookkeeping -- the activations are never reused
+        with torch.inference_mode():
+            vl_continuous_loss, vl_multinomial_loss = utils.joint_noise_estimation_loss(model,
+                                                                                        continuous_vl,
+                                                                                        discrete_vl_oh,
+                                                                                        diffusion,
+                                                                                        k,
+                                                                                        feature_indices,
+                                                                                        alphas_bar_sqrt,
+                                                                                        one_minus_alphas_bar_sqrt,
+                                                                                        num_steps)
+            vl_multinomial_loss = vl_multinomial_loss * discrete_lr
+            vl_continuous_loss = vl_continuous_loss * continuous_lr
+            validation_loss = vl_multinomial_loss + vl_continuous_loss
+
+            # get discrete distribution
+            if t % sample_every == 0 or t == training_time_steps - 1:
+                _,_, discrete_distribution = utils.get_tabular_model_output(model, k, 1000, feature_indices, continuous_tr.shape[1], diffusion, calculate_continuous=False)
+                discrete_distribution_list.append(discrete_distribution.squeeze(0))
+
+        # Average the validation loss across ranks so early stopping sees the same signal everywhere
+        if distributed:
+            validation_loss = validation_loss.clone()
+            dist.all_reduce(validation_loss)
+            validation_loss = validation_loss / world_size
 
         # Add training loss statistics
         if training_loss and validation_loss and tr_continuous_loss and tr_multinomial_loss and vl_continuous_loss and vl_multinomial_loss:
-            if show_loss and t % (training_time_steps // 10) == 0:
+            # Sync the combined losses to the host once per epoch and reuse the values
+            training_loss_item = training_loss.item()
+            validation_loss_item = validation_loss.item()
+            if show_loss and t % log_every == 0:
                 # Print losses statistics
                 print(f'Training Steps: {t}\n\t'
-                      f'Training Loss: {round(training_loss.item(), 8)}\t'
+                      f'Training Loss: {round(training_loss_item, 8)}\t'
                       f'Training Continuous Loss: {round(tr_continuous_loss.item(), 8)}\t'
                       f'Training Discrete Loss: {round(tr_multinomial_loss.item(), 8)}\n\t'
-                      f'Validation Loss: {round(validation_loss.item(), 8)}\t'
+                      f'Validation Loss: {round(validation_loss_item, 8)}\t'
                       f'Validation Continuous Loss: {round(vl_continuous_loss.item(), 8)}\t'
                       f'Validation Discrete Loss: {round(vl_multinomial_loss.item(), 8)}\n')
 
             # Early stopping if validation loss no longer decreases
-            if es(validation_loss.item(), debug=True):
+            # The comparison state stays on-device; only the final bool is synced here
+            if bool(es(validation_loss)):
                 # Print losses statistics
                 print(f'Early Stopped at Training Step: {t}\n\t'
-                      f'Training Loss: {round(training_loss.item(), 8)}\t'
+                      f'Training Loss: {round(training_loss_item, 8)}\t'
                       f'Training Continuous Loss: {round(tr_continuous_loss.item(), 8)}\t'
                       f'Training Discrete Loss: {round(tr_multinomial_loss.item(), 8)}\n\t'
-                      f'Validation Loss: {round(validation_loss.item(), 8)}\t'
+                      f'Validation Loss: {round(validation_loss_item, 8)}\t'
                       f'Validation Continuous Loss: {round(vl_continuous_loss.item(), 8)}\t'
                       f'Validation Discrete Loss: {round(vl_multinomial_loss.item(), 8)}\n')
                 break
 
             # Add losses to global lists
-            training_loss_list.append(training_loss.item())
-            validation_loss_list.append(validation_loss.item())
-
+            training_loss_list.append(training_loss_item)
+            validation_loss_list.append(validation_loss_item)
+
+
+    # Unwrap the torch.compile wrapper so the returned state_dict has bare keys
+    # (the OptimizedModule would prefix every key with _orig_mod. and break
+    # loading the checkpoint into a plain ConditionalTabularModel)
+    model = getattr(model, '_orig_mod', model)
+    # Likewise unwrap DistributedDataParallel so saved keys are not module.-prefixed;
+    # the wrapper was applied here after any user-supplied model was passed in
+    if distributed:
+        model = model.module
+
+    # Hand the results back on CPU: the callers plot the diagnostics with
+    # matplotlib, convert model outputs with .numpy(), and rebuild CPU schedule
+    # holders for sampling, none of which accept CUDA tensors
+    model = model.cpu()
+    discrete_distribution_list = [distribution.cpu() for distribution in discrete_distribution_list]
 
     return model, training_loss_list, validation_loss_list, discrete_distribution_list
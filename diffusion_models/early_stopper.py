@@ -1,31 +1,47 @@
 # External libraries
-import numpy as np
+import torch
 
 
 class EarlyStopper:
+    """Signals when the validation loss has stopped improving
+
+    State lives in tensors on the same device as the loss, so calling this with a
+    GPU loss does not force a host sync by itself.  The returned 0-dim bool tensor
+    only syncs when the caller materializes it (e.g. with bool() or .item()).
+    """
+
     def __init__(self, patience, min_delta):
         self.patience = patience
         self.min_delta = min_delta
-        self.counter = 0
-        self.max_counter = 0
-        self.min_validation_loss = np.inf
+        self.counter = None
+        self.max_counter = None
+        self.min_validation_loss = None
 
     def __call__(self, validation_loss, debug=False):
-        # if new validation loss is found, set new minimum and reset counter
-        if validation_loss < self.min_validation_loss:
-            self.min_validation_loss = validation_loss
-            self.counter = 0
-
-        # if validation loss is above the delta threshold, increase counter
-        elif validation_loss > (self.min_validation_loss + self.min_delta):
-            self.counter += 1
-            if self.counter > self.max_counter:
-                self.max_counter = max(self.counter, self.max_counter)
-                if debug and self.max_counter % (self.patience // 20) == 0:
-                    print(f'EarlyStopper New Counter Record: {self.max_counter}')
-            # return True when counter reaches patience threshold
-            if self.counter >= self.patience:
-                return True
-
-        # False otherwise
-        return False
+        if not torch.is_tensor(validation_loss):
+            validation_loss = torch.tensor(float(validation_loss))
+        validation_loss = validation_loss.detach()
+
+        # lazily allocate the state on the loss device the first time around
+        if self.min_validation_loss is None:
+            self.min_validation_loss = torch.full_like(validation_loss, float('inf'))
+            self.counter = torch.zeros_like(validation_loss)
+            self.max_counter = torch.zeros_like(validation_loss)
+
+        # if new validation loss is found, reset the counter
+        # if validation loss is above the delta threshold, increase the counter
+        # both branches run as tensor ops so nothing leaves the device
+        improved = validation_loss < self.min_validation_loss
+        above_delta = validation_loss > (self.min_validation_loss + self.min_delta)
+        self.counter = torch.where(improved, torch.zeros_like(self.counter), self.counter + above_delta)
+        self.min_validation_loss = torch.minimum(self.min_validation_loss, validation_loss)
+        self.max_counter = torch.maximum(self.max_counter, self.counter)
+
+        # counter-record reporting; only this opt-in path syncs the state to the host
+        if debug:
+            max_counter = int(self.max_counter.item())
+            if max_counter == int(self.counter.item()) and max_counter % max(self.patience // 20, 1) == 0:
+                print(f'EarlyStopper New Counter Record: {max_counter}')
+
+        # True when counter reaches patience threshold
+        return self.counter >= self.patience
@@ -1,3 +1,7 @@
+# External libraries
+import torch
+
+
 class EMA(object):
     """Exponential Moving Average Class
     Orignal source: https://github.com/acids-ircam/diffusion_models
@@ -8,18 +12,34 @@ class EMA(object):
     def __init__(self, mu=0.999):
         self.mu = mu
         self.shadow = {}
+        self.param_list = []
+        self.shadow_list = []
 
 
     def register(self, module):
+        self.shadow = {}
         for name, param in module.named_parameters():
             if param.requires_grad:
                 self.shadow[name] = param.data.clone()
+        self._cache_lists(module)
 
 
-    def update(self, module):
+    def _cache_lists(self, module):
+        """Caches aligned parameter/shadow lists so update can use fused foreach kernels"""
+        self.param_list = []
+        self.shadow_list = []
         for name, param in module.named_parameters():
             if param.requires_grad:
-                self.shadow[name].data = (1. - self.mu) * param.data + self.mu * self.shadow[name].data
+                self.param_list.append(param.data)
+                self.shadow_list.append(self.shadow[name])
+
+
+    def update(self, module):
+        if not self.shadow_list:
+            self._cache_lists(module)
+        # One fused kernel per op over all parameters instead of one launch per parameter
+        torch._foreach_mul_(self.shadow_list, self.mu)
+        torch._foreach_add_(self.shadow_list, self.param_list, alpha=1. - self.mu)
 
 
     def ema(self, module):
@@ -41,3 +61,6 @@ class EMA(object):
 
     def load_state_dict(self, state_dict):
         self.shadow = state_dict
+        # Invalidate the cached lists so they are rebuilt against the new shadow tensors
+        self.param_list = []
+        self.shadow_list = []
